@@ -0,0 +1,88 @@
+"""
+Decode/encode cost of a binary mode CloudEvent: the former dict based
+from_request/to_response against the CloudEventCodec.
+
+Reports the time per event and the peak of memory allocated while
+handling one event.
+
+    PYTHONPATH=src python benchmarks/bench_codec.py
+"""
+import json
+import timeit
+import tracemalloc
+
+from mindwm.model.events import MindwmEvent, codec
+from mindwm.model.objects import IoDocument
+
+source = "org.mindwm.alice.laptop.tmux.L3RtcC90bXV4LTEwMDAvZGVmYXVsdA==.e3f65957-a3d9-7c45-13b7-9e0a4c61bc0c.23.36"
+iodoc = IoDocument(input="ls -la",
+                   output="drwxr-xr-x  2 alice alice 4096 .\n" * 64,
+                   ps1="alice@laptop:~$")
+ev = MindwmEvent(source=source,
+                 subject="ls -la",
+                 data=iodoc,
+                 type=iodoc.type,
+                 traceparent="00-0244c99bf5fadc62cf25591940f1ae07-3d3c5f3dfc0911ab-01")
+headers, body = codec.encode_binary(ev)
+headers = {k.lower(): v for k, v in headers.items()}
+
+
+def legacy_decode():
+    obj = json.loads(body)
+    ev_dict = {}
+    for k in headers.keys():
+        if k.startswith('ce'):
+            ev_dict[k.lstrip('ce-')] = headers.get(k)
+        elif k == 'traceparent':
+            ev_dict[k] = headers.get(k)
+
+    ev_dict['data'] = obj
+    if 'type' in obj.keys():
+        ev_dict['type'] = obj['type']
+    else:
+        obj['type'] = ev_dict['type']
+
+    return MindwmEvent.model_validate(ev_dict)
+
+
+def legacy_encode():
+    out = {}
+    ev_dict = ev.model_dump()
+    for h in [k for k in ev_dict.keys() if k not in ['data']]:
+        if h == 'traceparent':
+            out['traceparent'] = ev_dict[h]
+        else:
+            out[f"CE-{h.capitalize()}"] = str(ev_dict[h])
+    out['content-type'] = 'application/json'
+    return (out, ev.data.model_dump_json())
+
+
+def codec_decode():
+    return codec.decode(headers, body)
+
+
+def codec_encode():
+    return codec.encode_binary(ev)
+
+
+def peak(fn) -> int:
+    tracemalloc.start()
+    fn()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    result = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return result
+
+
+if __name__ == "__main__":
+    assert legacy_decode() == codec_decode()
+    n = 20_000
+    for name, fn in [("legacy decode", legacy_decode),
+                     ("codec decode", codec_decode),
+                     ("legacy encode", legacy_encode),
+                     ("codec encode", codec_encode)]:
+        best = min(timeit.repeat(fn, number=n, repeat=5))
+        print(f"{name:>14}: {best / n * 1e6:7.2f} us/event"
+              f" {peak(fn):7d} B peak/event")
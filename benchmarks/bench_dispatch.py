@@ -0,0 +1,51 @@
+"""
+Per-call dispatch cost of the knfunc decorators: the legacy per-request
+`inspect.signature` walk against a dispatch plan built at decoration time.
+
+    PYTHONPATH=src python benchmarks/bench_dispatch.py
+"""
+import inspect
+import timeit
+
+from mindwm.knfunc.decorators import (Dispatch, _iodoc_injectors,
+                                      dispatch_plan, inject, source_identity)
+from mindwm.model.events import MindwmEvent
+from mindwm.model.objects import IoDocument
+
+source = "org.mindwm.alice.laptop.tmux.L3RtcC90bXV4LTEwMDAvZGVmYXVsdA==.e3f65957-a3d9-7c45-13b7-9e0a4c61bc0c.23.36"
+iodoc = IoDocument(input="uptime", output="up 17 days", ps1="$")
+ev = MindwmEvent(source=source, data=iodoc, type=iodoc.type)
+
+
+async def handler(iodocument: IoDocument, uuid: str, username: str,
+                  hostname: str, socket_path: str, tmux_session: str,
+                  tmux_pane: str, pane_title: str):
+    pass
+
+
+def legacy():
+    kwargs = dict(inspect.signature(handler).parameters)
+    identity = source_identity.__wrapped__(ev.source)
+    if 'iodocument' in kwargs:
+        kwargs['iodocument'] = iodoc
+    if 'uuid' in kwargs:
+        kwargs['uuid'] = iodoc.uuid
+    for name in identity._fields:
+        if name in kwargs:
+            kwargs[name] = getattr(identity, name)
+    return kwargs
+
+
+plan = dispatch_plan(handler, _iodoc_injectors)
+
+
+def planned():
+    return inject(plan, Dispatch(None, event=ev, obj=iodoc))
+
+
+if __name__ == "__main__":
+    assert legacy() == planned()
+    n = 100_000
+    for name, fn in [("legacy", legacy), ("plan", planned)]:
+        best = min(timeit.repeat(fn, number=n, repeat=5))
+        print(f"{name:>8}: {best / n * 1e6:.2f} us/call")
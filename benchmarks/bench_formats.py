@@ -0,0 +1,54 @@
+"""
+Binary mode CloudEvent in each available data format: JSON against
+MessagePack and CBOR, when installed.
+
+Reports the time to encode and decode an event and the size of its body.
+
+    PYTHONPATH=src python benchmarks/bench_formats.py
+"""
+import timeit
+
+from mindwm.model.codec import JSON_CONTENT_TYPE, formats
+from mindwm.model.events import MindwmEvent, codec
+from mindwm.model.objects import Clipboard, IoDocument
+
+source = "org.mindwm.alice.laptop.tmux.L3RtcC90bXV4LTEwMDAvZGVmYXVsdA==.e3f65957-a3d9-7c45-13b7-9e0a4c61bc0c.23.36"
+payloads = {
+    "iodocument":
+    IoDocument(input="ls -la",
+               output="drwxr-xr-x  2 alice alice 4096 .\n" * 64,
+               ps1="alice@laptop:~$"),
+    "clipboard":
+    Clipboard(uuid="1", time=1724929112, data="some copied text " * 16),
+}
+
+
+def event(data) -> MindwmEvent:
+    return MindwmEvent(source=source, subject="bench", data=data, type=data.type)
+
+
+if __name__ == "__main__":
+    n = 20_000
+    content_types = [
+        JSON_CONTENT_TYPE, *sorted({f.content_type
+                                   for f in formats.values()})
+    ]
+    for name, data in payloads.items():
+        ev = event(data)
+        for content_type in content_types:
+            headers, body = codec.encode_binary(ev, content_type=content_type)
+            headers = {k.lower(): v for k, v in headers.items()}
+            assert codec.decode(headers, body) == ev
+            encode = min(
+                timeit.repeat(lambda: codec.encode_binary(
+                    ev, content_type=content_type),
+                              number=n,
+                              repeat=5))
+            decode = min(
+                timeit.repeat(lambda: codec.decode(headers, body),
+                              number=n,
+                              repeat=5))
+            print(f"{name:>10} {content_type:>20}:"
+                  f" encode {encode / n * 1e6:6.2f} us"
+                  f" decode {decode / n * 1e6:6.2f} us"
+                  f" {len(body):6d} B")
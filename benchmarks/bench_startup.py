@@ -0,0 +1,59 @@
+"""
+Cold start of a knfunc: the time to import mindwm.knfunc.decorators and
+the time from the start of the process to the first served request.
+
+Every sample is a fresh interpreter, as a function scaled from zero is.
+Reports the median and the best of the samples.
+
+    PYTHONPATH=src python benchmarks/bench_startup.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SAMPLES = 7
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+from mindwm.knfunc.decorators import app, event
+from mindwm.model.objects import Ping, Pong
+t1 = time.perf_counter()
+
+@event
+async def ping(ping: Ping):
+    return Pong(uuid=ping.uuid)
+
+from fastapi.testclient import TestClient
+client = TestClient(app)
+t2 = time.perf_counter()
+r = client.post('/', content=Ping(uuid='1').model_dump_json(),
+                headers={'ce-id': '1', 'ce-source': 'bench', 'ce-type': 'ping',
+                         'ce-specversion': '1.0',
+                         'content-type': 'application/json'})
+assert r.status_code == 200, r.status_code
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'first request': t3 - t2,
+                  'first served': t3 - t0}))
+"""
+
+
+def sample() -> dict:
+    # the default exporter, which has nothing to export to here
+    env = dict(os.environ, OTEL_EXPORTER_OTLP_TIMEOUT='1', LOG_LEVEL='WARNING')
+    out = subprocess.run([sys.executable, '-c', CHILD],
+                         env=env,
+                         capture_output=True,
+                         check=True,
+                         text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    samples = [sample() for _ in range(SAMPLES)]
+    for name in samples[0]:
+        values = [s[name] for s in samples]
+        print(f"{name:>14}: {statistics.median(values) * 1e3:7.1f} ms median"
+              f" {min(values) * 1e3:7.1f} ms best")
@@ -34,6 +34,7 @@
           pyyaml
 	  openai
 	  cloudevents deprecation
+	  msgpack cbor2
         ]);
         project = pkgs.callPackage ./package.nix {
           my_python = pkgs.python3;
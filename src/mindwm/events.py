@@ -1,34 +1,170 @@
 import asyncio
-import json
 import logging
 import os
+from collections.abc import Awaitable, Callable, Hashable
+from contextlib import suppress
 from datetime import datetime
 from functools import partial
 from time import sleep
+from typing import List, Mapping, Optional, Type, Union
 
 import nats
-from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import \
-    OTLPSpanExporter as OTLPSpanGrpcExporter
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import (BatchSpanProcessor,
-                                            ConsoleSpanExporter)
-from opentelemetry.trace.propagation.tracecontext import \
-    TraceContextTextMapPropagator
-from pydantic import BaseModel
-
-from mindwm import logging
+from opentelemetry import metrics, trace
+from pydantic import BaseModel, ValidationError
 
-logger = logging.getLogger(__name__)
-trace.set_tracer_provider(
-    TracerProvider(resource=Resource.create({"service.name": __name__})))
+from mindwm import logging, tracing
+from mindwm.model.codec import body_format
+from mindwm.model.events import MindwmEvent, codec
+from mindwm.model.objects import MindwmObject
 
-trace.get_tracer_provider().add_span_processor(
-    BatchSpanProcessor(ConsoleSpanExporter()))
-trace.get_tracer_provider().add_span_processor(
-    BatchSpanProcessor(OTLPSpanGrpcExporter()))
+logger = logging.getLogger(__name__)
+tracing.configure(service_name=__name__)
 tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+
+Job = Callable[[], Awaitable]
+KeyFunc = Callable[[object], Optional[Hashable]]
+
+
+def header_key(name: str) -> KeyFunc:
+    """
+    Order the messages by a header, e.g. `ce-source` for a tmux pane or
+    `ce-subject`
+    """
+    return lambda msg: (msg.headers or {}).get(name)
+
+
+def message_headers(msg) -> dict[str, str]:
+    if not msg.headers:
+        return {}
+    return {k.lower(): v for k, v in msg.headers.items()}
+
+
+def decode(
+    headers: Mapping[str, str],
+    body: bytes,
+    model: Type[Union[MindwmEvent, MindwmObject]] = MindwmEvent
+) -> Union[MindwmEvent, MindwmObject]:
+    """
+    Validate a NATS message straight from its bytes.
+
+    A message with a `ce-type` header is in binary mode: the body is the
+    data and the CloudEvent attributes are the headers. Otherwise the body
+    is a structured event, as `publish` sends it.
+    """
+    if 'ce-type' in headers:
+        if model is MindwmEvent:
+            return codec.decode_binary(headers, body)
+        return codec.decode_model(model, headers, body)
+
+    ev = codec.decode_structured(body)
+    if model is MindwmEvent:
+        return ev
+    if not isinstance(ev.data, model):
+        raise ValueError(f"expected {model.__name__}, got {ev.type}")
+    return ev.data
+
+
+class Workers:
+    """
+    Runs the callbacks of a subscription on `concurrency` tasks, each with
+    a queue of up to `maxsize` messages.
+
+    The messages with the same key are queued to the same task and so are
+    handled in the order they arrived, the ones without a key go to the
+    shortest queue. `submit` waits while the queue is full, which leaves
+    the messages in the buffer of the subscription.
+    """
+
+    def __init__(self, name: str, concurrency: int = 4, maxsize: int = 100):
+        self.name = name
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def start(self):
+        if self._queues:
+            return
+
+        self._queues = [
+            asyncio.Queue(maxsize=self.maxsize)
+            for _ in range(self.concurrency)
+        ]
+        self._tasks = [
+            asyncio.create_task(self._work(q), name=f"{self.name}-{i}")
+            for i, q in enumerate(self._queues)
+        ]
+        logger.info(f"started {self.concurrency} workers for {self.name}")
+
+    async def submit(self, job: Job, key: Optional[Hashable] = None):
+        self.start()
+        if key is None:
+            queue = min(self._queues, key=asyncio.Queue.qsize)
+        else:
+            queue = self._queues[hash(key) % self.concurrency]
+        await queue.put(job)
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            self.busy += 1
+            try:
+                await job()
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"{self.name}: message handler failed: {e}")
+            finally:
+                self.busy -= 1
+                queue.task_done()
+
+    async def stop(self):
+        for queue in self._queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queues = []
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            'pending': self.pending,
+            'concurrency': self.concurrency,
+            'busy': self.busy,
+            'processed': self.processed,
+            'failed': self.failed,
+        }
+
+
+workers: dict[str, Workers] = {}
+
+
+def _observe(attr: str):
+
+    def callback(options):
+        return [
+            metrics.Observation(getattr(w, attr), {'subject': subj})
+            for subj, w in workers.items()
+        ]
+
+    return callback
+
+
+meter.create_observable_gauge('nats.subscription.pending',
+                              callbacks=[_observe('pending')],
+                              description='messages waiting for a worker')
+meter.create_observable_gauge('nats.subscription.busy',
+                              callbacks=[_observe('busy')],
+                              description='messages being handled')
 
 
 class NatsInterface:
@@ -36,8 +172,25 @@ class NatsInterface:
     def __init__(self):
         logger.debug(f"get NATS_URL from environment")
         self.url = os.environ.get('NATS_URL', 'nats://localhost:4222')
+        self.js_max_pending = int(
+            os.environ.get('NATS_JS_MAX_PENDING', '4000'))
+        self.concurrency = int(os.environ.get('NATS_WORKERS', '1'))
+        self.worker_queue_size = int(
+            os.environ.get('NATS_WORKER_QUEUE_SIZE', '100'))
+        self.queue = os.environ.get('NATS_QUEUE_GROUP', '')
+        self.body_format = body_format(os.environ.get('NATS_CONTENT_TYPE'))
+        self.max_reconnect_attempts = int(
+            os.environ.get('NATS_MAX_RECONNECT_ATTEMPTS', '-1'))
+        self.drain_timeout = float(os.environ.get('NATS_DRAIN_TIMEOUT', '30'))
+        self.reconnect_wait = float(os.environ.get('NATS_RECONNECT_WAIT',
+                                                   '1'))
+        self.max_reconnect_wait = float(
+            os.environ.get('NATS_MAX_RECONNECT_WAIT', '30'))
         self.nc = None
+        self.js = None
         self.subs = {}
+        self._closing = False
+        self._reconnecting = False
 
     async def init(self):
         logger.info(f"Initializing Nats interface for {self.url}")
@@ -46,39 +199,142 @@ class NatsInterface:
     async def loop(self):
         logger.debug(f"Entering main Nats interface loop")
 
-        # TODO: need to catch a signals about connection state
-        await asyncio.Future()
-        await self.nc.close()
+        try:
+            await asyncio.Future()
+        except asyncio.CancelledError:
+            await self.drain()
+            raise
 
     async def connect(self):
         if not self.nc:
-            self.nc = await nats.connect(self.url)
+            self.nc = await nats.connect(
+                self.url,
+                max_reconnect_attempts=self.max_reconnect_attempts,
+                disconnected_cb=self._disconnected,
+                reconnected_cb=self._reconnected,
+                closed_cb=self._closed)
             logger.info(f"Connected to {self.url}")
         else:
             logger.info("already connected")
 
-    async def subscribe(self, subj, callback):
-        self.subs[subj] = {}
-        handler = partial(self.message_handler, subj, callback)
-        await self.nc.subscribe(subj, cb=handler)
-        logger.info(f"Subscribed to NATS subject: {subj}")
+    async def _disconnected(self):
+        logger.warning(f"disconnected from {self.url}")
+
+    async def _reconnected(self):
+        # the client sends the subscriptions again by itself
+        logger.info(
+            f"reconnected to {self.nc.connected_url}, {len(self.subs)} subscriptions restored"
+        )
+
+    async def _closed(self):
+        if self._closing or self._reconnecting:
+            return
+
+        logger.warning(f"connection to {self.url} closed, reconnecting")
+        self._reconnecting = True
+        wait = self.reconnect_wait
+        try:
+            while not self._closing:
+                nc, self.nc, self.js = self.nc, None, None
+                if nc is not None and not nc.is_closed:
+                    # a connection left by a failed attempt
+                    with suppress(Exception):
+                        await nc.close()
+                try:
+                    await self.connect()
+                    for subj in self.subs:
+                        await self._subscribe(subj)
+                    return
+                except Exception as e:
+                    logger.error(
+                        f"failed to reconnect to {self.url}, retrying in {wait}s: {e}"
+                    )
+                await asyncio.sleep(wait)
+                wait = min(wait * 2, self.max_reconnect_wait)
+        finally:
+            self._reconnecting = False
+
+    async def subscribe(self,
+                        subj,
+                        callback,
+                        concurrency: Optional[int] = None,
+                        key: Optional[KeyFunc] = None,
+                        queue: Optional[str] = None,
+                        model: Optional[Type[Union[MindwmEvent,
+                                                   MindwmObject]]] = None):
+        """
+        Handle the messages of `subj` with `callback`, one at a time or,
+        with a `concurrency` above 1, on that many workers. The messages
+        `key` maps to the same value are handled in order.
+
+        With a `model`, MindwmEvent or a MindwmObject subclass, `callback`
+        gets the message validated as it, otherwise the `message` of its
+        JSON body.
+
+        The replicas subscribed with the same `queue` group (NATS_QUEUE_GROUP
+        by default) share the messages, each one is delivered to only one of
+        them.
+        """
+        concurrency = concurrency or self.concurrency
+        if model is None:
+            handler = partial(self.message_handler, subj, callback)
+        else:
+            handler = partial(self.typed_message_handler, subj, callback,
+                              model)
+        self.subs[subj] = {'queue': self.queue if queue is None else queue}
+        if concurrency > 1:
+            pool = Workers(subj, concurrency, self.worker_queue_size)
+            workers[subj] = pool
+            self.subs[subj]['workers'] = pool
+            handler = partial(self._dispatch, pool, handler, key)
+
+        self.subs[subj]['handler'] = handler
+        await self._subscribe(subj)
+
+    async def _subscribe(self, subj):
+        sub = self.subs[subj]
+        sub['sub'] = await self.nc.subscribe(subj,
+                                             queue=sub['queue'],
+                                             cb=sub['handler'])
+        logger.info(
+            f"Subscribed to NATS subject: {subj} {sub['queue'] or ''}".rstrip())
+
+    async def drain(self):
+        """
+        Stop taking messages, let the ones received be handled and the
+        replies be sent, then close the connection
+        """
+        if self.nc is None or self._closing:
+            return
+
+        self._closing = True
+        logger.info(f"draining {len(self.subs)} subscriptions")
+        try:
+            async with asyncio.timeout(self.drain_timeout):
+                for sub in self.subs.values():
+                    if 'sub' in sub:
+                        await sub['sub'].drain()
+                    if 'workers' in sub:
+                        await sub['workers'].stop()
+                await self.nc.drain()
+        except TimeoutError:
+            logger.warning(
+                f"drain not done within {self.drain_timeout}s, closing")
+            await self.nc.close()
+
+    async def _dispatch(self, pool: Workers, handler, key: Optional[KeyFunc],
+                        msg):
+        await pool.submit(partial(handler, msg),
+                          key(msg) if key is not None else None)
 
     async def publish(self, subj, payload):
-        carrier = {}
-        tracer = trace.get_tracer(__name__)
-        logger.debug(f"tracer: {tracer}")
-        logger.debug(f"__name__: {__name__}")
-        with tracer.start_as_current_span("publish") as span:
+        with tracing.start_span(tracer, "publish") as (span, headers):
             span.set_attribute("subject", subj)
             span.set_attribute("ce-id", payload.id)
             span.set_attribute("ce-subject", payload.subject)
             span.set_attribute("ce-source", payload.source)
             span.set_attribute("ce-type", payload.type)
-            ctx = span.get_span_context()
-            TraceContextTextMapPropagator().inject(carrier)
-            logger.debug(f"publish span context: {ctx}")
-            logger.debug(f"publish carrier: {carrier}")
-            headers = carrier
+            logger.debug(f"publish carrier: {headers}")
             # headers['Nats-Msg-Id'] = payload.id
             # headers['ce-id'] = payload.id
             # headers['ce-specversion'] = payload.specversion
@@ -89,29 +345,85 @@ class NatsInterface:
             # headers['traceparent'] = carrier['traceparent']
             # headers['tracestate'] = "key=val"
 
-            if 'traceparent' in headers.keys():
-                payload.traceparent = headers['traceparent']
-                payload.tracestate = f"subject={payload.subject}"
-
+            headers, body = self._encode(payload,
+                                         self._trace(payload, headers))
             logger.debug(f"send message to {subj}: {headers} {payload}")
 
-            await self.nc.publish(subj,
-                                  bytes(payload.model_dump_json(),
-                                        encoding='utf-8'),
-                                  headers=headers)
+            await self.nc.publish(subj, body, headers=headers)
+
+    def _encode(self, payload, headers: dict) -> tuple[dict, bytes]:
+        """
+        A structured JSON event, or a binary mode one with the data in
+        NATS_CONTENT_TYPE when it names an available format or when the
+        data may be compressed (EVENT_COMPRESSION)
+        """
+        binary = self.body_format is not None or codec.compression is not None
+        if binary and isinstance(payload, MindwmEvent):
+            content_type = self.body_format and self.body_format.content_type
+            return codec.encode_binary(payload, headers, content_type)
+        return headers, payload.model_dump_json().encode()
+
+    def _trace(self, payload, headers: dict) -> dict:
+        if 'traceparent' in headers.keys():
+            payload.traceparent = headers['traceparent']
+            payload.tracestate = f"subject={payload.subject}"
+        elif tracing.mode() == tracing.PROPAGATE:
+            # no span of our own, forward the trace of the payload
+            headers = {
+                k: getattr(payload, k)
+                for k in tracing.TRACE_HEADERS
+                if getattr(payload, k, None) is not None
+            }
+        return headers
+
+    def jetstream(self):
+        if self.js is None:
+            self.js = self.nc.jetstream(
+                publish_async_max_pending=self.js_max_pending)
+        return self.js
+
+    async def publish_batch(self, subj, payloads, jetstream=False):
+        """
+        Publish `payloads` to `subj` serialized in one pass and written to
+        the connection back to back, with a single flush at the end.
+
+        With `jetstream` they are published to the stream of `subj` without
+        waiting for each ack, with up to NATS_JS_MAX_PENDING of them in
+        flight, and the acks are returned.
+        """
+        with tracing.start_span(tracer, "publish_batch") as (span, headers):
+            span.set_attribute("subject", subj)
+            span.set_attribute("batch.size", len(payloads))
+            msgs = [
+                self._encode(payload, self._trace(payload, headers))
+                for payload in payloads
+            ]
+            logger.debug(f"send {len(msgs)} messages to {subj}")
+
+            if jetstream:
+                js = self.jetstream()
+                acks = [
+                    await js.publish_async(subj, body, headers=hdrs)
+                    for hdrs, body in msgs
+                ]
+                return await asyncio.gather(*acks)
+
+            for hdrs, body in msgs:
+                await self.nc.publish(subj, body, headers=hdrs)
+            await self.nc.flush()
 
     async def message_handler(self, subj, callback, msg):
-        tracer = trace.get_tracer(__name__)
         logger.debug(f"received: {subj}: {msg}")
-        data = json.loads(msg.data.decode())
-        carrier = {}
-        if 'traceparent' in msg.headers.keys():
-            carrier = {"traceparent": msg.headers['traceparent']}
-            logger.debug(f"message_handler: carrier: {carrier}")
-
-        ctx = TraceContextTextMapPropagator().extract(carrier=carrier)
-        with tracer.start_as_current_span("message_handler",
-                                          context=ctx) as span:
+        headers = message_headers(msg)
+        try:
+            # binary mode data may be compressed or not JSON
+            data = codec.decode_python(headers, msg.data)
+        except ValueError as e:
+            logger.warning(f"invalid message on {subj} dropped: {e}")
+            return None
+        carrier = tracing.trace_headers(headers)
+        with tracing.start_span(tracer, "message_handler",
+                                carrier) as (span, _):
             res = None
             if 'message' in data.keys():
                 message = data['message']
@@ -120,12 +432,36 @@ class NatsInterface:
                     res = await callback(message)
 
             span.set_attribute("subject", subj)
-            span.set_attribute("ce-id", msg.headers['ce-id'])
-            span.set_attribute("ce-subject", msg.headers['ce-subject'])
-            span.set_attribute("ce-source", msg.headers['ce-source'])
-            span.set_attribute("ce-type", msg.headers['ce-type'])
+            for k in ('ce-id', 'ce-subject', 'ce-source', 'ce-type'):
+                if k in headers:
+                    span.set_attribute(k, headers[k])
             return res
 
+    async def typed_message_handler(self, subj, callback, model, msg):
+        logger.debug(f"received: {subj}: {msg}")
+        headers = message_headers(msg)
+        try:
+            obj = decode(headers, msg.data, model)
+        except (ValidationError, ValueError) as e:
+            logger.warning(f"invalid message on {subj} dropped: {e}")
+            return None
+
+        carrier = tracing.trace_headers(headers)
+        if not carrier and isinstance(obj, MindwmEvent):
+            # a structured event carries its trace in its attributes
+            carrier = {
+                k: getattr(obj, k)
+                for k in tracing.TRACE_HEADERS if getattr(obj, k) is not None
+            }
+        with tracing.start_span(tracer, "message_handler",
+                                carrier) as (span, _):
+            span.set_attribute("subject", subj)
+            span.set_attribute("ce-type", obj.type)
+            for k in ('ce-id', 'ce-subject', 'ce-source'):
+                if k in headers:
+                    span.set_attribute(k, headers[k])
+            return await callback(obj)
+
 
 _nats = NatsInterface()
 
@@ -136,9 +472,25 @@ async def init():
     loop.create_task(_nats.loop())  #, "NATS interface")
 
 
-async def subscribe(subject: str, callback: callable):
-    await _nats.subscribe(subject, callback)
+async def subscribe(subject: str,
+                    callback: callable,
+                    concurrency: Optional[int] = None,
+                    key: Optional[KeyFunc] = None,
+                    queue: Optional[str] = None,
+                    model: Optional[Type[Union[MindwmEvent,
+                                               MindwmObject]]] = None):
+    await _nats.subscribe(subject, callback, concurrency, key, queue, model)
+
+
+async def drain():
+    await _nats.drain()
 
 
 async def publish(subject: str, payload: BaseModel):
     await _nats.publish(subject, payload)
+
+
+async def publish_batch(subject: str,
+                        payloads: list[BaseModel],
+                        jetstream: bool = False):
+    return await _nats.publish_batch(subject, payloads, jetstream)
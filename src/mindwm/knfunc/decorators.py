@@ -1,45 +1,38 @@
 import inspect
-import json
 import os
 from base64 import b64decode
 from collections.abc import Callable
-from functools import wraps
-from typing import Optional
-from uuid import uuid4
+from datetime import datetime, timezone
+from functools import lru_cache, partial, wraps
+from operator import attrgetter
+from typing import Any, NamedTuple, Optional
 
 import mindwm.model.graph as graphModel
-from cloudevents.conversion import to_structured
-from cloudevents.http import CloudEvent as CE
+import mindwm.model.runtime as graphRuntime
 from fastapi import FastAPI, Request, Response, status
-from fastapi.responses import JSONResponse
-from mindwm import logging
-from mindwm.model.events import MindwmEvent, from_request, to_response
-from mindwm.model.graph import KafkaCdc
-from mindwm.model.objects import IoDocument, LLMAnswer, Touch, Clipboard
-from neontology import auto_constrain, init_neontology
+from mindwm import logging, tracing
+from mindwm.model.events import (MindwmEvent, batch_from_request, codec,
+                                 from_request, is_batch, to_batch_response,
+                                 to_response, to_structured_response)
+from mindwm.model.ingest import ingest
+from mindwm.knfunc.dedup import (caches, dedup_cache, duplicate_reply,
+                                 in_flight)
+from mindwm.knfunc.router import Router, payload_types
+from mindwm.knfunc.warmup import Warmup
+from mindwm.knfunc.workqueue import queues, work_queue
+from mindwm.model.objects import (Clipboard, IoDocument, LLMAnswer,
+                                  MindwmObject, Touch)
 from opentelemetry import trace
-from opentelemetry._logs import set_logger_provider
-from opentelemetry.exporter.otlp.proto.grpc._log_exporter import \
-    OTLPLogExporter
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import \
-    OTLPSpanExporter as OTLPSpanGrpcExporter
-from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
-from opentelemetry.sdk.resources import HOST_NAME, SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import (BatchSpanProcessor,
-                                            ConsoleSpanExporter)
-from opentelemetry.trace.propagation import set_span_in_context
-from opentelemetry.trace.propagation.tracecontext import \
-    TraceContextTextMapPropagator
-
-span_processor = BatchSpanProcessor(OTLPSpanGrpcExporter())
-trace_provider = TracerProvider(active_span_processor=span_processor)
-trace.set_tracer_provider(trace_provider)
+
+tracing.configure()
 
 logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger(__name__)
 app = FastAPI()
+router = Router()
+app.post('/')(router.dispatch)
+warm = Warmup()
+app.router.on_startup.append(partial(warm.start, router.dispatch))
 
 
 @app.get("/")
@@ -54,52 +47,300 @@ def liveness():
 
 @app.get("/health/readiness")
 def readiness():
+    if warm.done and not graphRuntime.ready():
+        # no event arrives while not ready, so the graph is retried here
+        graphRuntime.init()
+    if not warm.done or not graphRuntime.ready():
+        return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
     return "OK"
 
 
-def event(func):
+@app.get("/health/queues")
+def queues_health():
+    return {name: q.stats() for name, q in queues.items()}
 
-    @app.post('/')
-    async def wrapper(request: Request,
-                      response: Response) -> Optional[MindwmEvent]:
-        ev = await from_request(request)
+
+@app.get("/health/dedup")
+def dedup_health():
+    return {name: c.stats() for name, c in caches.items()}
+
+
+@app.get("/health/warmup")
+def warmup_health():
+    return warm.stats()
+
+
+@app.get("/health/graph")
+def graph_health():
+    return graphRuntime.health()
+
+
+class SourceIdentity(NamedTuple):
+    username: str
+    hostname: str
+    tmux_b64: str
+    tmux_session: str
+    tmux_pane: str
+    tmux_socket_path: str
+    socket_path: str
+    session_id: str
+    pane_title: str
+
+
+@lru_cache(maxsize=1024)
+def source_identity(source: str) -> SourceIdentity:
+    """
+    Split an event source into the tmux hierarchy it came from.
+    A pane emits many events with the same source, so the result is cached
+    """
+    [username, hostname, _, tmux_b64, _some_id, tmux_session, tmux_pane
+     ] = source.lstrip('mindwm').lstrip('org.mindwm').split('.')
+    tmux_socket_path = str(b64decode(tmux_b64)).strip()
+    tmux_socket_path = tmux_socket_path.strip("b'").strip('/')
+    socket_path = f"{username}@{hostname}/{tmux_socket_path}"
+    session_id = f"{socket_path}:{tmux_session}"
+    pane_title = f"{session_id}%{tmux_pane}"
+    return SourceIdentity(username, hostname, tmux_b64, tmux_session,
+                          tmux_pane, tmux_socket_path, socket_path, session_id,
+                          pane_title)
+
+
+class Dispatch:
+    """
+    Per-request state the injectors of a dispatch plan read from
+    """
+    __slots__ = ('request', 'response', 'event', 'obj')
+
+    def __init__(self,
+                 request: Request,
+                 response: Optional[Response] = None,
+                 event: Optional[MindwmEvent] = None,
+                 obj: Any = None):
+        self.request = request
+        self.response = response
+        self.event = event
+        self.obj = obj
+
+    @property
+    def identity(self) -> SourceIdentity:
+        return source_identity(self.event.source)
+
+
+Injector = Callable[[Dispatch], Any]
+DispatchPlan = list[tuple[str, Injector]]
+
+
+def dispatch_plan(func: Callable, injectors: dict[str,
+                                                  Injector]) -> DispatchPlan:
+    """
+    Resolve once, at decoration time, which of the `injectors` the
+    signature of `func` asks for
+    """
+    plan = [(name, injectors[name])
+            for name in inspect.signature(func).parameters
+            if name in injectors]
+    if any(name == 'graph' for name, _ in plan):
+        # connected to on warm-up instead of on the first event
+        graphRuntime.require()
+    return plan
+
+
+def inject(plan: DispatchPlan, dispatch: Dispatch) -> dict[str, Any]:
+    return {name: injector(dispatch) for name, injector in plan}
+
+
+def _identity_field(name: str) -> Injector:
+    return lambda d: getattr(d.identity, name)
+
+
+def _header(name: str) -> Injector:
+    return lambda d: d.request.headers.get(name)
+
+
+def _graph(d: Dispatch):
+    if not graphRuntime.ready():
+        graphRuntime.init_background()
+    return graphModel
+
+
+_event_injectors = {
+    'request': attrgetter('request'),
+    'response': attrgetter('response'),
+    'event': attrgetter('event'),
+}
+
+_iodoc_injectors = {
+    'iodocument': attrgetter('obj'),
+    'uuid': attrgetter('obj.uuid'),
+    'graph': _graph,
+} | {name: _identity_field(name)
+     for name in SourceIdentity._fields}
+
+_clipboard_injectors = {
+    'clipboard': attrgetter('event'),
+    'traceparent': _header('traceparent'),
+    'uuid': _header('ce-id'),
+    'time': attrgetter('event.data.time'),
+    'data': attrgetter('event.data.data'),
+    # TODO: take the identity from the event source
+    'username': lambda d: "bebebeka",
+    'hostname': lambda d: "laptop",
+    'graph': _graph,
+}
+
+_llm_answer_injectors = {
+    'answer': attrgetter('event.data'),
+}
+
+
+def _structured_response(func_name: str, value, subject: Optional[str],
+                         response: Response) -> Response:
+    context_name = os.environ.get('CONTEXT_NAME', 'NO_CONTEXT')
+    ev = MindwmEvent(
+        source=f"mindwm.{context_name}.knfunc.{func_name}",
+        #subject=f"{source}.feedback",
+        # TODO: fix the subject to variant from above when we implement new naming convention
+        subject=subject,
+        type=value.type,
+        time=datetime.now(timezone.utc).isoformat(),
+        data=value)
+    resp = to_structured_response(ev)
+    logger.debug(f"response: {resp.headers}\n{resp.body}")
+    response.headers.update(resp.headers)
+    return resp
+
+
+def event(func=None,
+          *,
+          batch: bool = False,
+          types: Optional[list[str]] = None,
+          accept: bool = False,
+          queue_size: Optional[int] = None,
+          workers: Optional[int] = None,
+          dedup: bool = False,
+          dedup_replies: bool = True,
+          warmup: Optional[MindwmObject] = None):
+    """
+    Serve `func` for the CloudEvents POSTed to `/`.
+
+    `func` is routed the events of `types`, by default the types of the
+    payload models its first parameter is annotated with.
+
+    The elements of an `application/cloudevents-batch+json` request are
+    passed to `func` one by one, or all at once as a list when `batch` is
+    set, and the replies are returned as a single batch.
+
+    With `accept` the validated event is put on a bounded queue served by
+    `workers` tasks and answered with 202 at once, or with 429 when the
+    queue is full so the broker retries later. Replies of `func` are
+    dropped in this mode.
+
+    With `dedup` an event redelivered with the same source and id within
+    KNFUNC_DEDUP_WINDOW seconds does not run `func` again and gets the
+    reply of the first delivery, unless `dedup_replies` is unset, or 429
+    while the first delivery is still running. A batch is answered like
+    that when all of its events were delivered before, otherwise only
+    its new events are run and only their replies are sent.
+
+    A `warmup` payload is dispatched to `func` on startup, before the
+    readiness probe reports OK, from the tmux pane
+    `knfunc@warmup/tmp/knfunc-warmup:0%0`.
+    """
+    if func is None:
+        return partial(event,
+                       batch=batch,
+                       types=types,
+                       accept=accept,
+                       queue_size=queue_size,
+                       workers=workers,
+                       dedup=dedup,
+                       dedup_replies=dedup_replies,
+                       warmup=warmup)
+
+    service_name = f"knfunc.{func.__name__}"
+    tracer = trace.get_tracer(service_name)
+    plan = dispatch_plan(func, _event_injectors)
+    logger.info(f"my service_name: {service_name}")
+
+    queue = None
+    if accept:
+        queue = work_queue(
+            service_name,
+            maxsize=queue_size
+            or int(os.environ.get('KNFUNC_QUEUE_SIZE', '100')),
+            workers=workers or int(os.environ.get('KNFUNC_WORKERS', '4')))
+        app.router.on_shutdown.append(queue.stop)
+
+    seen = None
+    if dedup:
+        seen = dedup_cache(
+            service_name,
+            maxsize=int(os.environ.get('KNFUNC_DEDUP_SIZE', '10000')),
+            window=float(os.environ.get('KNFUNC_DEDUP_WINDOW', '600')),
+            cache_replies=dedup_replies)
+
+    def reply(res_obj, subject: Optional[str],
+              trace_headers: dict) -> MindwmEvent:
+        context_name = os.environ.get('CONTEXT_NAME', 'NO_CONTEXT')
+        res_ev = MindwmEvent(data=res_obj, type=res_obj.type)
+        res_ev.source = f"org.mindwm.{context_name}.knfunc.{func.__name__}"
+        res_ev.subject = subject
+        res_ev.traceparent = trace_headers.get('traceparent')
+        res_ev.tracestate = trace_headers.get('tracestate')
+        return res_ev
+
+    async def handle_batch(request: Request, response: Response,
+                           evs: list[MindwmEvent]) -> Response:
+        logger.debug(f"batch of {len(evs)} events received")
+        with tracing.start_span(tracer, service_name,
+                                request.headers) as (span, extra_headers):
+            span.set_attribute("batch.size", len(evs))
+
+            replies = []
+            if batch:
+                kwargs = inject(plan, Dispatch(request, response, evs))
+                res_objs = await func([ev.data for ev in evs], **kwargs)
+                sources = {ev.source for ev in evs}
+                subject = sources.pop() if len(sources) == 1 else None
+                replies = [
+                    reply(obj, subject, extra_headers)
+                    for obj in res_objs or [] if obj
+                ]
+            else:
+                for ev in evs:
+                    kwargs = inject(plan, Dispatch(request, response, ev))
+                    res_obj = await func(ev.data, **kwargs)
+                    if isinstance(res_obj, Response):
+                        logger.warning(
+                            f"{service_name} replied with a raw Response to a batched event, dropped"
+                        )
+                    elif res_obj:
+                        replies.append(
+                            reply(res_obj, ev.source, extra_headers))
+
+            if not replies:
+                return Response(status_code=status.HTTP_200_OK)
+            return to_batch_response(replies, extra_headers)
+
+    async def handle(request: Request, response: Response,
+                     ev: MindwmEvent) -> Response:
         logger.debug(f"event received: {ev}")
         logger.debug(f"request headers: {request.headers}")
-        service_name = f"knfunc.{func.__name__}"
-        func_sig = inspect.signature(func)
-        xx = [p.annotation for p in func_sig.parameters.values()]
-        kwargs = dict(func_sig.parameters)
-        ctx = TraceContextTextMapPropagator().extract(carrier=request.headers)
-        headers = response.headers
-        tracer = trace.get_tracer(service_name)
-        logger.info(f"my service_name: {service_name}")
 
         headers = {}
-        with tracer.start_as_current_span(service_name, context=ctx) as span:
-            extra_headers = {}
-            ctx = set_span_in_context(span)
-            TraceContextTextMapPropagator().inject(extra_headers, ctx)
-
-            new_kwargs = {}
-            if 'request' in kwargs.keys():
-                new_kwargs['request'] = request
-            if 'response' in kwargs.keys():
-                new_kwargs['response'] = response
-
-            res_obj = await func(ev.data, **new_kwargs)
+        with tracing.start_span(tracer, service_name,
+                                request.headers) as (_, extra_headers):
+            kwargs = inject(plan, Dispatch(request, response, ev))
+            res_obj = await func(ev.data, **kwargs)
             if type(res_obj) is Response:
                 return res_obj
 
-            context_name = os.environ.get('CONTEXT_NAME', 'NO_CONTEXT')
             if res_obj:
-                res_ev = MindwmEvent(data=res_obj, type=res_obj.type)
-                if 'traceparent' in headers.keys():
-                    res_ev.traceparent = extra_headers['traceparent']
-
-                res_ev.source = f"org.mindwm.{context_name}.knfunc.{func.__name__}"
-                res_ev.subject = request.headers['ce-source']
+                res_ev = reply(res_obj, ev.source, extra_headers)
                 logger.debug(f'reply with MindwmEvent: {res_ev}')
-                resp = to_response(res_ev, extra_headers)
+                # the reply is encoded like the event was
+                resp = to_response(res_ev, extra_headers,
+                                   request.headers.get('content-type'))
                 # extra_headers['content-type'] = 'application/cloudevents+json'
                 # extra_headers['ce-knativebrokerttl'] = '255'
                 # resp = Response(content=res_ev.model_dump_json(),
@@ -112,67 +353,101 @@ def event(func):
                 return Response(status_code=status.HTTP_200_OK,
                                 headers=headers)
 
+    async def released_on_failure(job, keys):
+        try:
+            return await job()
+        except Exception:
+            for key in keys:
+                seen.release(key)
+            raise
 
-def iodoc(func):
+    async def spill_released(job, request):
+        try:
+            return await job()
+        finally:
+            ingest.release(request)
 
-    @event
+    async def wrapper(request: Request,
+                      response: Response) -> Optional[MindwmEvent]:
+        if is_batch(request):
+            evs = await batch_from_request(request)
+            if seen is not None:
+                claims = [(ev, seen.claim((ev.source, ev.id))) for ev in evs]
+                dups = [dup for _, dup in claims if dup is not None]
+                running = [dup for dup in dups if in_flight(dup)]
+                if running:
+                    # retried as a whole once the first delivery is over
+                    for ev, dup in claims:
+                        if dup is None:
+                            seen.release((ev.source, ev.id))
+                    return duplicate_reply(running[0])
+                evs = [ev for ev, dup in claims if dup is None]
+                if not evs:
+                    logger.info(f"{service_name}: duplicate batch")
+                    return duplicate_reply(dups[0])
+            keys = [(ev.source, ev.id) for ev in evs]
+            job = partial(handle_batch, request, response, evs)
+        else:
+            ev = await from_request(request)
+            keys = [(ev.source, ev.id)]
+            if seen is not None:
+                dup = seen.claim(keys[0])
+                if dup is not None:
+                    logger.info(f"{service_name}: duplicate event {ev.id}")
+                    return duplicate_reply(dup)
+            job = partial(handle, request, response, ev)
+
+        if seen is not None:
+            job = partial(released_on_failure, job, keys)
+
+        if queue is None:
+            resp = await job()
+            if seen is not None:
+                for key in keys:
+                    seen.complete(key, resp)
+            return resp
+
+        # the spilled fields of the event outlive the request until the job
+        ingest.hold(request)
+        if not queue.submit(partial(spill_released, job, request)):
+            ingest.release(request)
+            logger.warning(f"{service_name}: work queue is full")
+            if seen is not None:
+                for key in keys:
+                    seen.release(key)
+            return Response(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={'retry-after': '1'})
+        resp = Response(status_code=status.HTTP_202_ACCEPTED)
+        if seen is not None:
+            for key in keys:
+                seen.complete(key, resp)
+        return resp
+
+    router.add(wrapper, payload_types(func) if types is None else types)
+    if warmup is not None:
+        warm.add(warmup)
+    return wrapper
+
+
+def iodoc(func=None, *, warmup: Optional[IoDocument] = None):
+    if func is None:
+        return partial(iodoc, warmup=warmup)
+
+    plan = dispatch_plan(func, _iodoc_injectors)
+
+    @event(warmup=warmup)
     async def wrapper(iodoc_obj: IoDocument,
-                      request: Request = None) -> MindwmEvent:
-        logger.info(f"input iodoc: {iodoc_obj}")
-        logger.info(f"input request headers: {request.headers}")
-        ev = await from_request(request)
-        logger.info(f"event: {ev}")
-        func_sig = inspect.signature(func)
-        xx = [p.annotation for p in func_sig.parameters.values()]
-        kwargs = dict(func_sig.parameters)
-        logger.info(f"kwargs: {kwargs}")
-        carrier = None
+                      request: Request = None,
+                      event: MindwmEvent = None) -> MindwmEvent:
+        logger.debug(f"input iodoc: {iodoc_obj}")
+        logger.debug(f"input request headers: {request.headers}")
         if 'traceparent' in request.headers.keys():
-            carrier = request.headers.get('traceparent')
-            iodoc_obj.traceparent = carrier
+            iodoc_obj.traceparent = request.headers.get('traceparent')
 
         if 'tracestate' in request.headers.keys():
             iodoc_obj.tracestate = request.headers.get('tracestate')
 
-        uuid = iodoc_obj.uuid
-        [username, hostname, _, tmux_b64, _some_id, tmux_session, tmux_pane
-         ] = ev.source.lstrip('mindwm').lstrip('org.mindwm').split('.')
-        tmux_socket_path = str(b64decode(tmux_b64)).strip()
-        tmux_socket_path = tmux_socket_path.strip("b'").strip('/')
-        socket_path = f"{username}@{hostname}/{tmux_socket_path}"
-        session_id = f"{socket_path}:{tmux_session}"
-        pane_title = f"{session_id}%{tmux_pane}"
-        if 'iodocument' in kwargs:
-            kwargs['iodocument'] = iodoc_obj
-        if 'uuid' in kwargs:
-            kwargs['uuid'] = uuid
-        if 'username' in kwargs:
-            kwargs['username'] = username
-        if 'hostname' in kwargs:
-            kwargs['hostname'] = hostname
-        if 'tmux_b64' in kwargs:
-            kwargs['tmux_b64'] = tmux_b64
-        if 'tmux_session' in kwargs:
-            kwargs['tmux_session'] = tmux_session
-        if 'tmux_pane' in kwargs:
-            kwargs['tmux_pane'] = tmux_pane
-        if 'tmux_socket_path' in kwargs:
-            kwargs['tmux_socket_path'] = tmux_socket_path
-        if 'socket_path' in kwargs:
-            kwargs['socket_path'] = socket_path
-        if 'session_id' in kwargs:
-            kwargs['session_id'] = session_id
-        if 'pane_title' in kwargs:
-            kwargs['pane_title'] = pane_title
-        if 'graph' in kwargs:
-            try:
-                init_neontology()
-                auto_constrain()
-            except Exception as e:
-                logger.error("failed to initialize Neontology", e)
-
-            kwargs['graph'] = graphModel
-
+        kwargs = inject(plan, Dispatch(request, event=event, obj=iodoc_obj))
         return await func(**kwargs)
 
     return wrapper
@@ -191,151 +466,65 @@ def touch(func):
         return value
 
 
-def llm_answer(func):
+def llm_answer(func=None, *, warmup: Optional[LLMAnswer] = None):
+    if func is None:
+        return partial(llm_answer, warmup=warmup)
+
+    service_name = f"knfunc.{func.__name__}"
+    tracer = trace.get_tracer(service_name)
+    plan = dispatch_plan(func, _llm_answer_injectors)
 
-    @app.post("/")
     async def wrapper(r: Request, response: Response):
-        func_sig = inspect.signature(func)
-        xx = [p.annotation for p in func_sig.parameters.values()]
-        kwargs = dict(func_sig.parameters)
-        b = await r.body()
+        # the router may have read the body already to find the event type
+        headers, b = await ingest.read(r)
         logger.debug(f"request headers: {r.headers}\nbody: {b}")
-        uuid = r.headers.get('ce-id')
-        source = r.headers.get('ce-source')
-        subject = r.headers.get('ce-subject')
-        if 'answer' in kwargs:
-            answer_ev = LLMAnswerEvent.model_validate_json(b)
-            kwargs['answer'] = answer_ev.data
-
-        @with_trace(carrier=r.headers)
-        @wraps(func)
-        async def inner(**kwargs):
+        ev = codec.decode(headers, b)
+        kwargs = inject(plan, Dispatch(r, response, ev))
+
+        with tracing.start_span(tracer, service_name, r.headers):
             value = await func(**kwargs)
             logger.debug(f"return value: {value}")
-            logger.info(f"inner")
-            carrier = None
+            if not value:
+                return Response(status_code=status.HTTP_200_OK)
+
             if 'traceparent' in r.headers.keys():
-                carrier = r.headers.get('traceparent')
-                value.traceparent = carrier
-                value.traceparent = carrier
+                value.traceparent = r.headers.get('traceparent')
 
             if 'tracestate' in r.headers.keys():
                 value.tracestate = r.headers.get('tracestate')
 
             logger.debug(f"with injected traces: {value}")
-            if not value:
-                return Response(status_code=status.HTTP_200_OK)
-            else:
-                context_name = os.environ.get('CONTEXT_NAME', 'NO_CONTEXT')
-                obj_ev = CloudEvent.make_obj_event(value)
-                attributes = {
-                    "id": uuid4().hex,
-                    "source": f"mindwm.{context_name}.knfunc.{func.__name__}",
-                    #"subject": f"{source}.feedback",
-                    # TODO: fix the subject to variant from above when we implement new naming convention
-                    "subject": subject,
-                    "type": obj_ev.type,
-                    #"ce-traceparent": r.headers.get('ce-traceparent')
-                }
-                data = obj_ev.model_dump()
-                event = CE(attributes, data)
-                headers, body = to_structured(event)
-                #headers['content-type'] = 'application/cloudevents+json'
-                logger.debug(f"response: {headers}\n{body}")
-                response.headers.update(headers)
-                return JSONResponse(content=json.loads(body), headers=headers)
-
-        res = await inner(**kwargs)
-        return res
+            return _structured_response(func.__name__, value, ev.subject,
+                                        response)
 
+    router.add(wrapper, [LLMAnswer.model_fields['type'].default])
+    if warmup is not None:
+        warm.add(warmup)
     return wrapper
 
-def clipboard(func):
 
-    @app.post("/")
-    async def wrapper(r: Request, response: Response):
-        func_sig = inspect.signature(func)
-        xx = [p.annotation for p in func_sig.parameters.values()]
-        kwargs = dict(func_sig.parameters)
-        b = await r.body()
-        logger.debug(f"request headers: {r.headers}\nbody: {b}")
-        uuid = r.headers.get('ce-id')
-        source = r.headers.get('ce-source')
-        subject = r.headers.get('ce-subject')
-        ce_type = r.headers.get('ce-type')
-        # TODO(@metacoma) fix usage
-        ce_traceparent = r.headers.get('traceparent')
+def clipboard(func=None, *, warmup: Optional[Clipboard] = None):
+    if func is None:
+        return partial(clipboard, warmup=warmup)
 
+    plan = dispatch_plan(func, _clipboard_injectors)
+
+    async def wrapper(r: Request, response: Response):
+        logger.debug(f"request headers: {r.headers}")
+        # TODO(@metacoma) fix usage of the traceparent
         ev = await from_request(r)
-        logger.info(f"event: {ev}")
-
-        clipboard_ev = Clipboard.model_validate_json(b)
-
-        user = "bebebeka"
-        host = "laptop"
-
-        if 'clipboard' in kwargs:
-            kwargs['clipboard'] = ev
-        if 'traceparent' in kwargs:
-            kwargs['traceparent'] = ce_traceparent
-        if 'uuid' in kwargs:
-            kwargs['uuid'] = uuid
-        if 'time' in kwargs:
-            kwargs['time'] = ev.data.time
-        if 'data' in kwargs:
-            kwargs['data'] = ev.data.data
-        if 'username' in kwargs:
-            kwargs['username'] = user
-        if 'hostname' in kwargs:
-            kwargs['hostname'] = host
-        if 'graph' in kwargs:
-            try:
-                init_neontology()
-                auto_constrain()
-            except Exception as e:
-                logger.error("failed to initialize Neontology", e)
-
-            kwargs['graph'] = graphModel
-
-
-        @wraps(func)
-        async def inner(**kwargs):
-            value = await func(**kwargs)
-            logger.debug(f"return value: {value}")
-            logger.info(f"inner")
-            carrier = None
-            # if 'traceparent' in r.headers.keys():
-            #     carrier = r.headers.get('traceparent')
-            #     value.traceparent = carrier
-            #     value.traceparent = carrier
-            #
-            # if 'tracestate' in r.headers.keys():
-            #     value.tracestate = r.headers.get('tracestate')
+        logger.debug(f"event: {ev}")
 
-            logger.debug(f"with injected traces: {value}")
-            if not value:
-                return Response(status_code=status.HTTP_200_OK)
-            else:
-                context_name = os.environ.get('CONTEXT_NAME', 'NO_CONTEXT')
-                obj_ev = CloudEvent.make_obj_event(value)
-                attributes = {
-                    "id": uuid4().hex,
-                    "source": f"mindwm.{context_name}.knfunc.{func.__name__}",
-                    #"subject": f"{source}.feedback",
-                    # TODO: fix the subject to variant from above when we implement new naming convention
-                    "subject": subject,
-                    "type": obj_ev.type,
-                    #"ce-traceparent": r.headers.get('ce-traceparent')
-                }
-                data = obj_ev.model_dump()
-                event = CE(attributes, data)
-                headers, body = to_structured(event)
-                #headers['content-type'] = 'application/cloudevents+json'
-                logger.debug(f"response: {headers}\n{body}")
-                response.headers.update(headers)
-                return JSONResponse(content=json.loads(body), headers=headers)
-
-        res = await inner(**kwargs)
-        return res
+        kwargs = inject(plan, Dispatch(r, response, ev))
+        value = await func(**kwargs)
+        logger.debug(f"return value: {value}")
+        if not value:
+            return Response(status_code=status.HTTP_200_OK)
+
+        return _structured_response(func.__name__, value, ev.subject,
+                                    response)
 
+    router.add(wrapper, [Clipboard.model_fields['type'].default])
+    if warmup is not None:
+        warm.add(warmup)
     return wrapper
@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Hashable, NamedTuple, Optional
+
+from fastapi import Response
+from mindwm import logging
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+received_counter = meter.create_counter(
+    'knfunc.events.received', description='events received by a handler')
+duplicates_counter = meter.create_counter(
+    'knfunc.events.duplicates',
+    description='redelivered events answered without running the handler')
+
+
+class Reply(NamedTuple):
+    status_code: int
+    body: bytes
+    headers: dict
+
+    @classmethod
+    def of(cls, response: Response) -> 'Reply':
+        return cls(response.status_code, response.body,
+                   dict(response.headers))
+
+    def response(self) -> Response:
+        return Response(content=self.body,
+                        status_code=self.status_code,
+                        headers=self.headers)
+
+
+_IN_FLIGHT = Reply(0, b"", {})
+# processed, without a reply to replay
+_DONE = Reply(200, b"", {})
+
+
+class DedupCache:
+    """
+    Ids of the events processed within the last `window` seconds, with
+    the reply sent for each of them when `cache_replies` is set.
+
+    An id is claimed before the handler runs, so a redelivery arriving
+    while the first delivery is still processed is not run twice: it is
+    answered with 429 so the broker retries it, as the first delivery may
+    yet fail. The id is released when the handler fails so the next
+    retry runs it again.
+    """
+
+    def __init__(self,
+                 name: str,
+                 maxsize: int = 10000,
+                 window: float = 600,
+                 cache_replies: bool = True):
+        self.name = name
+        self.maxsize = maxsize
+        self.window = window
+        self.cache_replies = cache_replies
+        self.received = 0
+        self.duplicates = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Reply]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def duplicate_rate(self) -> float:
+        return self.duplicates / self.received if self.received else 0.0
+
+    def claim(self, key: Hashable) -> Optional[Reply]:
+        """
+        Claim `key` for processing, or get the reply to its first delivery
+        when it is a duplicate
+        """
+        now = monotonic()
+        attributes = {'handler': self.name}
+        received_counter.add(1, attributes)
+        with self._lock:
+            self.received += 1
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.duplicates += 1
+                duplicates_counter.add(1, attributes)
+                return entry[1]
+
+            self._entries[key] = (now + self.window, _IN_FLIGHT)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return None
+
+    def complete(self, key: Hashable, response: Optional[Response] = None):
+        reply = _DONE
+        if self.cache_replies and response is not None:
+            reply = Reply.of(response)
+
+        with self._lock:
+            if key in self._entries:
+                expires, _ = self._entries[key]
+                self._entries[key] = (expires, reply)
+
+    def release(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'window': self.window,
+            'received': self.received,
+            'duplicates': self.duplicates,
+            'duplicate_rate': self.duplicate_rate,
+        }
+
+
+caches: dict[str, DedupCache] = {}
+
+
+def dedup_cache(name: str, maxsize: int, window: float,
+                cache_replies: bool) -> DedupCache:
+    if name in caches:
+        raise ValueError(f"dedup cache {name} already exists")
+    caches[name] = DedupCache(name, maxsize, window, cache_replies)
+    return caches[name]
+
+
+def in_flight(reply: Reply) -> bool:
+    return reply is _IN_FLIGHT
+
+
+def duplicate_reply(reply: Reply) -> Response:
+    if reply is _IN_FLIGHT:
+        return Response(status_code=429, headers={'retry-after': '1'})
+    return reply.response()
@@ -0,0 +1,134 @@
+import inspect
+from collections.abc import Awaitable, Callable
+from typing import List, Optional, Union, get_args, get_origin
+
+from fastapi import Request, Response, status
+from mindwm import logging
+from mindwm.model.codec import BATCH_CONTENT_TYPE, STRUCTURED_CONTENT_TYPE
+from mindwm.model.ingest import BodyTooLarge, ingest
+from pydantic import BaseModel, TypeAdapter
+
+logger = logging.getLogger(__name__)
+
+Endpoint = Callable[[Request, Response], Awaitable[Response]]
+
+
+class _TypeProbe(BaseModel):
+    type: str
+
+
+_batch_probe = TypeAdapter(List[_TypeProbe])
+
+
+def payload_types(func: Callable) -> List[str]:
+    """
+    CloudEvent types of the payload model(s) the first parameter of `func`
+    is annotated with
+    """
+    params = list(inspect.signature(func).parameters.values())
+    if not params:
+        return []
+
+    annotation = params[0].annotation
+    if get_origin(annotation) is Union:
+        candidates = get_args(annotation)
+    else:
+        candidates = (annotation, )
+
+    types = []
+    for cls in candidates:
+        fields = getattr(cls, 'model_fields', {})
+        if 'type' in fields and isinstance(fields['type'].default, str):
+            types.append(fields['type'].default)
+
+    return types
+
+
+class Router:
+    """
+    Dispatches the CloudEvents POSTed to a knfunc to the handler registered
+    for their `ce-type`, so one process may serve several functions.
+
+    The type is looked up before the payload is validated: it comes from
+    the `ce-type` header in binary mode and from a probe of the `type`
+    attribute alone in structured and batch mode. A handler registered
+    without types receives the events no other handler is registered for.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, Endpoint] = {}
+        self._default: Optional[Endpoint] = None
+        self._endpoints: List[Endpoint] = []
+
+    def add(self, endpoint: Endpoint, types: List[str] = []):
+        for t in types:
+            if t in self._handlers:
+                raise ValueError(f"a handler for {t} is already registered")
+            self._handlers[t] = endpoint
+
+        if not types:
+            if self._default is not None:
+                raise ValueError("a default handler is already registered")
+            self._default = endpoint
+
+        self._endpoints.append(endpoint)
+        logger.debug(f"registered {endpoint} for {types or 'any type'}")
+
+    def types(self) -> List[str]:
+        return list(self._handlers.keys())
+
+    def lookup(self, ce_type: Optional[str]) -> Optional[Endpoint]:
+        endpoint = self._handlers.get(ce_type, self._default)
+        if endpoint is None and len(self._endpoints) == 1:
+            # a single handler process serves whatever it receives
+            return self._endpoints[0]
+
+        return endpoint
+
+    async def _event_type(self, request: Request) -> Optional[str]:
+        ce_type = request.headers.get('ce-type')
+        if ce_type is not None:
+            return ce_type
+
+        content_type = request.headers.get('content-type', '')
+        if content_type.startswith(STRUCTURED_CONTENT_TYPE):
+            _, body = await ingest.read(request)
+            return _TypeProbe.model_validate_json(body).type
+
+        if content_type.startswith(BATCH_CONTENT_TYPE):
+            _, body = await ingest.read(request)
+            types = {probe.type for probe in _batch_probe.validate_json(body)}
+            if len(types) > 1:
+                raise ValueError(f"mixed event types in a batch: {types}")
+            return types.pop() if types else None
+
+        return None
+
+    async def dispatch(self, request: Request, response: Response):
+        # the fields spilled while reading the event go with the request
+        ingest.hold(request)
+        try:
+            return await self._dispatch(request, response)
+        finally:
+            ingest.release(request)
+
+    async def _dispatch(self, request: Request, response: Response):
+        try:
+            ce_type = await self._event_type(request)
+        except BodyTooLarge as e:
+            logger.warning(f"event refused: {e}")
+            return Response(status_code=status.HTTP_413_CONTENT_TOO_LARGE)
+        except ValueError as e:
+            logger.warning(f"unable to route the event: {e}")
+            return Response(status_code=status.HTTP_400_BAD_REQUEST)
+
+        endpoint = self.lookup(ce_type)
+        if endpoint is None:
+            logger.warning(f"no handler registered for {ce_type}")
+            return Response(status_code=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return await endpoint(request, response)
+        except BodyTooLarge as e:
+            logger.warning(f"event refused: {e}")
+            return Response(status_code=status.HTTP_413_CONTENT_TOO_LARGE)
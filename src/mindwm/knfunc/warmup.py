@@ -0,0 +1,104 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from time import perf_counter
+from typing import List, Optional
+
+import mindwm.model.runtime as graphRuntime
+from fastapi import Request, Response
+from mindwm import logging, tracing
+from mindwm.model.events import MindwmEvent, codec
+from mindwm.model.objects import MindwmObject
+
+logger = logging.getLogger(__name__)
+
+# <username>.<hostname>.tmux.<socket path>.<id>.<session>.<pane> like the
+# sources of the panes, so the handlers find an identity in it
+WARMUP_SOURCE = 'org.mindwm.knfunc.warmup.tmux.L3RtcC9rbmZ1bmMtd2FybXVw.warmup.0.0'
+
+Dispatch = Callable[[Request, Response], Awaitable[Response]]
+
+
+def synthetic_request(ev: MindwmEvent) -> Request:
+    """
+    Binary mode POST / request of `ev`, served without a server
+    """
+    headers, body = codec.encode_binary(ev)
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/',
+        'query_string': b'',
+        'headers': [(k.lower().encode(), v.encode())
+                    for k, v in headers.items()],
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    return Request(scope, receive)
+
+
+def prebuild_models():
+    for cls in [MindwmEvent, *MindwmObject._subclasses.values()]:
+        if not cls.__pydantic_complete__:
+            cls.model_rebuild()
+    MindwmObject.type_adapter()
+
+
+class Warmup:
+    """
+    Startup work paid for before the knfunc reports ready rather than by
+    the first event: the pydantic models are built, the trace exporters
+    and the graph connection pool are opened, and the synthetic events
+    the handlers asked for are dispatched like a POSTed event would be.
+
+    It runs in the background so liveness is answered meanwhile.
+    """
+
+    def __init__(self):
+        self.events: List[MindwmEvent] = []
+        self.durations: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self.done = False
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, obj: MindwmObject):
+        self.events.append(
+            MindwmEvent(source=WARMUP_SOURCE, type=obj.type, data=obj))
+
+    async def _step(self, name: str, fn: Callable, *args):
+        start = perf_counter()
+        try:
+            res = fn(*args)
+            if asyncio.iscoroutine(res):
+                res = await res
+            return res
+        except Exception as e:
+            logger.warning(f"warm-up step {name} failed: {e}")
+            self.errors[name] = str(e)
+        finally:
+            self.durations[name] = perf_counter() - start
+
+    async def run(self, dispatch: Dispatch):
+        await self._step('models', prebuild_models)
+        await self._step('tracing', asyncio.to_thread, tracing.warmup)
+        if graphRuntime.required():
+            await self._step('graph', graphRuntime.run, graphRuntime.init)
+        for ev in self.events:
+            resp = await self._step(f"event {ev.type}", dispatch,
+                                    synthetic_request(ev), Response())
+            if resp is not None and resp.status_code >= 400:
+                self.errors[f"event {ev.type}"] = f"status {resp.status_code}"
+
+        self.done = True
+        logger.info(f"warm-up done: {self.durations}")
+
+    async def start(self, dispatch: Dispatch):
+        self._task = asyncio.create_task(self.run(dispatch), name='warmup')
+
+    def stats(self) -> dict:
+        return {
+            'done': self.done,
+            'durations': self.durations,
+            'errors': self.errors,
+        }
@@ -0,0 +1,133 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import List, Optional
+
+from mindwm import logging
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+Job = Callable[[], Awaitable]
+
+
+class WorkQueue:
+    """
+    Bounded in-process queue of jobs served by a fixed number of workers.
+
+    `submit` never waits: when the queue is full the job is refused so
+    the caller can push back on the sender. The workers are started on
+    the first submitted job, `stop` lets them drain the queue.
+    """
+
+    def __init__(self, name: str, maxsize: int = 100, workers: int = 4):
+        if workers < 1:
+            # the jobs accepted would never run
+            raise ValueError(f"{name}: at least one worker is needed")
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = workers
+        self.busy = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def utilization(self) -> float:
+        return self.busy / self.workers
+
+    def start(self):
+        if self._queue is not None:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"{self.name}-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"started {self.workers} workers for {self.name}")
+
+    def submit(self, job: Job) -> bool:
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+        self.accepted += 1
+        return True
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            self.busy += 1
+            try:
+                await job()
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"{self.name}: job failed: {e}")
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+
+    async def stop(self):
+        if self._queue is None:
+            return
+
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'maxsize': self.maxsize,
+            'workers': self.workers,
+            'busy': self.busy,
+            'utilization': self.utilization,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'failed': self.failed,
+        }
+
+
+queues: dict[str, WorkQueue] = {}
+
+
+def _observe(attr: str):
+
+    def callback(options):
+        return [
+            metrics.Observation(getattr(q, attr), {'queue': name})
+            for name, q in queues.items()
+        ]
+
+    return callback
+
+
+meter.create_observable_gauge('knfunc.queue.depth',
+                              callbacks=[_observe('depth')],
+                              description='jobs waiting for a worker')
+meter.create_observable_gauge('knfunc.queue.utilization',
+                              callbacks=[_observe('utilization')],
+                              description='share of busy workers')
+
+
+def work_queue(name: str, maxsize: int, workers: int) -> WorkQueue:
+    if name in queues:
+        raise ValueError(f"work queue {name} already exists")
+    queues[name] = WorkQueue(name, maxsize, workers)
+    return queues[name]
@@ -0,0 +1,143 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, Optional, Tuple, Type
+
+import mindwm.model.runtime as runtime
+from mindwm import logging
+from neontology import BaseNode, BaseRelationship
+
+from .ingest import REF_SCHEME, open_reference, remove_reference
+
+logger = logging.getLogger(__name__)
+
+BLOB_REF = 'blob:'
+
+
+class BlobStore:
+    """
+    Content addressed store of the large fields of graph nodes, such as
+    IoDocument.output and Clipboard.data.
+
+    A content of at least `min_size` characters is merged into the graph
+    as a `blob_cls` node keyed by its SHA-256, so the same command output
+    is stored once however many times it was seen. The field of the node
+    is emptied, its `<field>_blob` set to `blob:<hash>` and the node is
+    connected to the blob.
+
+    A field cut on ingestion with the `reference` policy is stored whole:
+    the blob gets the text its `<field>_ref` points to, and the spilled
+    file is removed once written.
+
+    The hashes of the blobs written are remembered, up to `maxsize` of
+    them, so a content already stored is not sent to the graph again.
+    """
+
+    def __init__(self,
+                 blob_cls: Type[BaseNode],
+                 fields: Dict[Type[BaseNode], Tuple[str,
+                                                    Type[BaseRelationship]]],
+                 min_size: int = 256,
+                 maxsize: int = 100000):
+        self.blob_cls = blob_cls
+        self.fields = fields
+        self.min_size = min_size
+        self.maxsize = maxsize
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_deduplicated = 0
+        self._hashes: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, digest: str) -> bool:
+        with self._lock:
+            if digest in self._hashes:
+                self._hashes.move_to_end(digest)
+                return True
+            return False
+
+    def _add(self, digest: str):
+        with self._lock:
+            self._hashes[digest] = None
+            self._hashes.move_to_end(digest)
+            while len(self._hashes) > self.maxsize:
+                self._hashes.popitem(last=False)
+
+    def forget(self, digest: str):
+        with self._lock:
+            self._hashes.pop(digest, None)
+
+    def offload(self, uow, node: BaseNode) -> BaseNode:
+        """
+        Move the large field of `node` to a blob written by `uow`
+        """
+        field = self.fields.get(type(node))
+        if field is None:
+            return node
+
+        name, rel_cls = field
+        content = getattr(node, name)
+        ref = getattr(node, f"{name}_ref", None)
+        spilled = ref is not None and ref.startswith(REF_SCHEME)
+        if spilled:
+            try:
+                with open_reference(ref) as f:
+                    content = f.read()
+            except OSError as e:
+                logger.warning(f"{ref} is not readable, cut text stored: {e}")
+                spilled = False
+        if content is None or len(content) < self.min_size:
+            return node
+
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        if digest in self:
+            self.deduplicated += 1
+            self.bytes_deduplicated += len(content)
+            blob = self.blob_cls(hash=digest)
+        else:
+            blob = uow.merge(
+                self.blob_cls(hash=digest, content=content, size=len(content)))
+            uow.after_flush(partial(self._add, digest))
+            self.stored += 1
+
+        setattr(node, name, None)
+        setattr(node, f"{name}_blob", f"{BLOB_REF}{digest}")
+        if spilled:
+            setattr(node, f"{name}_ref", None)
+            uow.after_flush(partial(remove_reference, ref))
+        uow.merge(rel_cls(source=node, target=blob))
+        return node
+
+    def load(self, ref: str) -> Optional[str]:
+        """
+        The content `ref` refers to, None when there is no such blob
+        """
+        if not ref.startswith(BLOB_REF):
+            raise ValueError(f"not a blob reference: {ref}")
+        blob = self.blob_cls.match(ref[len(BLOB_REF):])
+        return blob.content if blob is not None else None
+
+    async def aload(self, ref: str) -> Optional[str]:
+        return await runtime.run(self.load, ref)
+
+    def observe(self, changed):
+        """
+        Forget the blobs deleted from the graph, from a GraphObjectDeleted
+        """
+        if changed.type == 'org.mindwm.v1.graph.deleted' and isinstance(
+                changed.obj, self.blob_cls):
+            self.forget(changed.obj.hash)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._hashes),
+            'maxsize': self.maxsize,
+            'min_size': self.min_size,
+            'stored': self.stored,
+            'deduplicated': self.deduplicated,
+            'bytes_deduplicated': self.bytes_deduplicated,
+        }
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable, Optional, Union
+
+from mindwm import logging
+from neontology import BaseNode, BaseRelationship
+
+logger = logging.getLogger(__name__)
+
+
+def node_key(node: BaseNode) -> tuple:
+    return (node.__primarylabel__, getattr(node, node.__primaryproperty__))
+
+
+def object_key(obj: Union[BaseNode, BaseRelationship]) -> tuple:
+    if isinstance(obj, BaseNode):
+        return node_key(obj)
+    return (obj.get_relationship_type(), node_key(obj.source),
+            node_key(obj.target))
+
+
+class GraphCache:
+    """
+    Bounded LRU set of graph nodes and relationships known to exist.
+
+    Nodes are keyed by the primary label and the value of the
+    `__primaryproperty__`, relationships by the relationship type and the
+    keys of both ends. An entry expires `ttl` seconds after it was added.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[Hashable, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, obj: Union[BaseNode, BaseRelationship]) -> bool:
+        key = object_key(obj)
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is not None and expires > monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+
+            if expires is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False
+
+    def add(self, obj: Union[BaseNode, BaseRelationship]):
+        key = object_key(obj)
+        expires = monotonic() + self.ttl if self.ttl is not None else float(
+            'inf')
+        with self._lock:
+            self._entries[key] = expires
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, obj: Union[BaseNode, BaseRelationship]):
+        key = object_key(obj)
+        with self._lock:
+            self._entries.pop(key, None)
+            if isinstance(obj, BaseNode):
+                # a node is deleted together with its relationships
+                for k in [
+                        k for k in self._entries
+                        if len(k) == 3 and key in (k[1], k[2])
+                ]:
+                    del self._entries[k]
+            self.invalidations += 1
+
+    def observe(self, changed: Any):
+        """
+        Keep the cache consistent with a GraphObjectCreated/Updated/Deleted
+        """
+        if changed.type == 'org.mindwm.v1.graph.deleted':
+            logger.debug(f"invalidate deleted object: {changed.obj}")
+            self.invalidate(changed.obj)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+graph_cache = GraphCache(maxsize=int(os.environ.get('GRAPH_CACHE_SIZE',
+                                                    '10000')),
+                         ttl=float(os.environ.get('GRAPH_CACHE_TTL', '300')))
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from time import monotonic
+from typing import Dict, List, Optional, Union
+
+from mindwm import logging
+from mindwm.model.cache import object_key
+from mindwm.model.graph import (GraphObjectChanged, GraphObjectCreated,
+                                GraphObjectDeleted, GraphObjectUpdated,
+                                GraphTransaction, KafkaCdc)
+
+logger = logging.getLogger(__name__)
+
+
+async def _sweep(take: Callable[[], list], emit: Callable[[list], Awaitable],
+                 interval: float):
+    while True:
+        # a zero window or timeout is not a reason to spin
+        await asyncio.sleep(max(interval, 0.01))
+        taken = take()
+        if not taken:
+            continue
+        try:
+            await emit(taken)
+        except Exception as e:
+            logger.warning(f"failed to forward {len(taken)} CDC changes: {e}")
+
+
+class _Transaction:
+    __slots__ = ('tx_id', 'count', 'deadline', 'records')
+
+    def __init__(self, tx_id: int, count: int, deadline: float):
+        self.tx_id = tx_id
+        self.count = count
+        self.deadline = deadline
+        self.records: Dict[int, KafkaCdc] = {}
+
+    def graph_transaction(self) -> GraphTransaction:
+        records = [self.records[i] for i in sorted(self.records)]
+        return GraphTransaction(
+            tx_id=self.tx_id,
+            complete=len(self.records) == self.count,
+            changes=GraphObjectChanged.from_kafka_cdc_batch(records))
+
+
+class CdcTransactions:
+    """
+    Reassembles the CDC records of a Neo4j transaction, `txEventsCount`
+    of them sharing a `txId`, into one GraphTransaction.
+
+    A transaction whose records did not all arrive within `timeout`
+    seconds of the first one, or the oldest one when more than
+    `max_records` records are buffered, is given up on and handed out by
+    `expired` with `complete` unset.
+    """
+
+    def __init__(self, timeout: float = 5, max_records: int = 10000):
+        self.timeout = timeout
+        self.max_records = max_records
+        self.buffered = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.evicted = 0
+        self._transactions: OrderedDict[int, _Transaction] = OrderedDict()
+        self._expired: List[_Transaction] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    def add(self, cdc: KafkaCdc) -> Optional[GraphTransaction]:
+        """
+        Buffer `cdc`, get the transaction when it was the last record of it
+        """
+        meta = cdc.meta
+        with self._lock:
+            tx = self._transactions.get(meta.txId)
+            if tx is None:
+                tx = _Transaction(meta.txId, meta.txEventsCount,
+                                  monotonic() + self.timeout)
+                self._transactions[meta.txId] = tx
+
+            if meta.txEventId not in tx.records:
+                self.buffered += 1
+            tx.records[meta.txEventId] = cdc
+            if len(tx.records) == tx.count:
+                del self._transactions[meta.txId]
+                self.buffered -= tx.count
+                self.completed += 1
+            else:
+                tx = None
+
+            while self.buffered > self.max_records:
+                _, oldest = self._transactions.popitem(last=False)
+                logger.warning(
+                    f"too many CDC records buffered, transaction {oldest.tx_id} is given up"
+                )
+                self.buffered -= len(oldest.records)
+                self.evicted += 1
+                self._expired.append(oldest)
+
+        return tx.graph_transaction() if tx is not None else None
+
+    def expired(self) -> List[GraphTransaction]:
+        """
+        Take the transactions given up on since the last call
+        """
+        now = monotonic()
+        with self._lock:
+            while self._transactions:
+                tx = next(iter(self._transactions.values()))
+                if tx.deadline > now:
+                    break
+                del self._transactions[tx.tx_id]
+                self.buffered -= len(tx.records)
+                self.timed_out += 1
+                self._expired.append(tx)
+
+            expired, self._expired = self._expired, []
+
+        return [tx.graph_transaction() for tx in expired]
+
+    async def sweep(self,
+                    emit: Callable[[List[GraphTransaction]], Awaitable],
+                    interval: Optional[float] = None):
+        """
+        Hand the expired transactions to `emit` every `interval` seconds,
+        `timeout` by default, so the last transaction of a burst does not
+        wait for a record to come
+        """
+        await _sweep(self.expired, emit, interval or self.timeout)
+
+    def stats(self) -> dict:
+        return {
+            'transactions': len(self._transactions),
+            'buffered': self.buffered,
+            'max_records': self.max_records,
+            'timeout': self.timeout,
+            'completed': self.completed,
+            'timed_out': self.timed_out,
+            'evicted': self.evicted,
+        }
+
+
+GraphChange = Union[GraphObjectCreated, GraphObjectUpdated, GraphObjectDeleted]
+
+
+class CdcCoalescer:
+    """
+    Collapses the updates of the same graph object made within `window`
+    seconds into the last of them.
+
+    Objects are keyed like in the GraphCache: nodes by label and primary
+    property, relationships by type and the keys of both ends. Creates
+    and deletes pass through at once, a delete drops the updates of the
+    object still held. An update is held from its first arrival until
+    the window is over, or until more than `maxsize` objects are held,
+    and then handed out by `due` in the latest state seen.
+    """
+
+    def __init__(self, window: float = 1, maxsize: int = 10000):
+        self.window = window
+        self.maxsize = maxsize
+        self.received = 0
+        self.forwarded = 0
+        self.coalesced = 0
+        self._pending: OrderedDict[tuple, list] = OrderedDict()
+        self._due: List[GraphChange] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, change: Union[KafkaCdc,
+                                GraphChange]) -> Optional[GraphChange]:
+        """
+        Get `change` back when it is to be forwarded at once, or hold it
+        """
+        if isinstance(change, KafkaCdc):
+            change = GraphObjectChanged.from_kafka_cdc(change)
+
+        key = object_key(change.obj)
+        with self._lock:
+            self.received += 1
+            if not isinstance(change, GraphObjectUpdated):
+                if isinstance(change, GraphObjectDeleted) and self._pending.pop(
+                        key, None) is not None:
+                    self.coalesced += 1
+                self.forwarded += 1
+                return change
+
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = change
+                self.coalesced += 1
+                return None
+
+            self._pending[key] = [monotonic() + self.window, change]
+            while len(self._pending) > self.maxsize:
+                _, (_, oldest) = self._pending.popitem(last=False)
+                self._due.append(oldest)
+
+        return None
+
+    def due(self, flush: bool = False) -> List[GraphChange]:
+        """
+        Take the updates whose window is over, or all of them with `flush`
+        """
+        now = monotonic()
+        with self._lock:
+            while self._pending:
+                key, (deadline, change) = next(iter(self._pending.items()))
+                if deadline > now and not flush:
+                    break
+                del self._pending[key]
+                self._due.append(change)
+
+            due, self._due = self._due, []
+            self.forwarded += len(due)
+
+        return due
+
+    async def sweep(self,
+                    emit: Callable[[List[GraphChange]], Awaitable],
+                    interval: Optional[float] = None):
+        """
+        Hand the updates due to `emit` every `interval` seconds, `window`
+        by default, so the last update of a burst is not held until the
+        next change comes
+        """
+        await _sweep(self.due, emit, interval or self.window)
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'maxsize': self.maxsize,
+            'window': self.window,
+            'received': self.received,
+            'forwarded': self.forwarded,
+            'coalesced': self.coalesced,
+        }
+
+
+cdc_transactions = CdcTransactions(
+    timeout=float(os.environ.get('CDC_TX_TIMEOUT', '5')),
+    max_records=int(os.environ.get('CDC_TX_MAX_RECORDS', '10000')))
+
+cdc_coalescer = CdcCoalescer(
+    window=float(os.environ.get('CDC_COALESCE_WINDOW', '1')),
+    maxsize=int(os.environ.get('CDC_COALESCE_SIZE', '10000')))
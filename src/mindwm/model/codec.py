@@ -0,0 +1,311 @@
+import gzip
+import io
+import json
+from functools import partial
+from typing import (Annotated, Any, BinaryIO, Callable, Dict, List, Mapping,
+                    NamedTuple, Optional, Tuple, Type, Union, get_args)
+
+from mindwm import logging
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = 'application/json'
+STRUCTURED_CONTENT_TYPE = 'application/cloudevents+json'
+BATCH_CONTENT_TYPE = 'application/cloudevents-batch+json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+CBOR_CONTENT_TYPE = 'application/cbor'
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+class BodyFormat(NamedTuple):
+    """
+    Serialization of the data of a binary mode event other than JSON,
+    from and to the JSON compatible python objects pydantic dumps
+    """
+    content_type: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+formats: Dict[str, BodyFormat] = {}
+
+
+def register_format(fmt: BodyFormat, *aliases: str):
+    for content_type in (fmt.content_type, *aliases):
+        formats[content_type] = fmt
+
+
+try:
+    import msgpack
+    register_format(
+        BodyFormat(MSGPACK_CONTENT_TYPE, msgpack.packb,
+                   partial(msgpack.unpackb, raw=False)),
+        'application/x-msgpack', 'application/vnd.msgpack')
+except ImportError:
+    pass
+
+try:
+    import cbor2
+    register_format(BodyFormat(CBOR_CONTENT_TYPE, cbor2.dumps, cbor2.loads))
+except ImportError:
+    pass
+
+
+class Compression(NamedTuple):
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+    # a reader of the decompressed content of a file object
+    open: Callable[[BinaryIO], BinaryIO]
+
+
+# the CloudEvent extension attribute naming the compression of the data
+ENCODING_HEADER = 'ce-dataencoding'
+
+compressions: Dict[str, Compression] = {
+    'gzip':
+    Compression('gzip', partial(gzip.compress, compresslevel=6, mtime=0),
+                gzip.decompress, lambda f: gzip.GzipFile(fileobj=f)),
+}
+
+try:
+    import zstandard
+    compressions['zstd'] = Compression(
+        'zstd',
+        zstandard.ZstdCompressor().compress,
+        zstandard.ZstdDecompressor().decompress,
+        lambda f: zstandard.ZstdDecompressor().stream_reader(f))
+except ImportError:
+    pass
+
+
+def body_format(content_type: Optional[str]) -> Optional[BodyFormat]:
+    """
+    The format of `content_type`, None for JSON or one not available
+    """
+    if not content_type:
+        return None
+    return formats.get(content_type.split(';', 1)[0].strip().lower())
+
+
+class CloudEventCodec:
+    """
+    Binary and structured content mode of CloudEvents for an event model
+    whose `data` is a union discriminated by `type`.
+
+    The header tables and the per-type data validators are built once, so
+    an event is validated straight from the body bytes and encoded
+    without an intermediate dict.
+
+    Compressed data is refused with BodyTooLarge when it decompresses to
+    more than `max_size` bytes.
+    """
+
+    def __init__(self,
+                 event_cls: Type[BaseModel],
+                 compression: Optional[str] = None,
+                 compress_threshold: int = 1024,
+                 max_size: Optional[int] = None):
+        self.event_cls = event_cls
+        self.max_size = max_size
+        if compression and compression not in compressions:
+            logger.warning(
+                f"compression {compression} is not available, data is sent as is"
+            )
+        self.compression = compressions.get(compression or '')
+        self.compress_threshold = compress_threshold
+        attrs = [name for name in event_cls.model_fields if name != 'data']
+        self._from_headers = {f"ce-{name}": name for name in attrs}
+        self._from_headers['traceparent'] = 'traceparent'
+        self._to_headers = [(name, 'traceparent' if name == 'traceparent'
+                             else f"CE-{name.capitalize()}")
+                            for name in attrs]
+        data_union = event_cls.model_fields['data'].annotation
+        self._data_types = {
+            cls.model_fields['type'].default: cls
+            for cls in get_args(data_union)
+        }
+        self._data_adapter = TypeAdapter(
+            Annotated[data_union, Field(discriminator='type')])
+        self._batch_adapter = TypeAdapter(List[event_cls])
+
+    def attributes(self, headers: Mapping[str, str]) -> Dict[str, str]:
+        attrs = {}
+        for k, v in headers.items():
+            name = self._from_headers.get(k)
+            if name is not None:
+                attrs[name] = v
+
+        return attrs
+
+    def decode_data(self,
+                    body: Union[bytes, str],
+                    type: Optional[str],
+                    fmt: Optional[BodyFormat] = None):
+        if fmt is not None:
+            return self._decode_data_python(fmt.loads(body), type)
+
+        data_cls = self._data_types.get(type)
+        if data_cls is not None:
+            try:
+                return data_cls.model_validate_json(body)
+            except ValidationError:
+                # the payload may declare a type of its own
+                pass
+
+        return self._data_adapter.validate_json(body)
+
+    def _decode_data_python(self, obj: Any, type: Optional[str]):
+        data_cls = self._data_types.get(type)
+        if data_cls is not None:
+            try:
+                return data_cls.model_validate(obj)
+            except ValidationError:
+                pass
+
+        return self._data_adapter.validate_python(obj)
+
+    def decode_model(self, model: Type[BaseModel], headers: Mapping[str, str],
+                     body: Union[bytes, str]) -> BaseModel:
+        """
+        Validate the data of a binary mode event as `model`
+        """
+        body = self.decompress(headers, body)
+        fmt = body_format(headers.get('content-type'))
+        if fmt is not None:
+            return model.model_validate(fmt.loads(body))
+        return model.model_validate_json(body)
+
+    def decode_binary(self, headers: Mapping[str, str],
+                      body: Union[bytes, str]) -> BaseModel:
+        attrs = self.attributes(headers)
+        body = self.decompress(headers, body)
+        data = self.decode_data(body, attrs.get('type'),
+                                body_format(headers.get('content-type')))
+        attrs['type'] = data.type
+        attrs['data'] = data
+        return self.event_cls.model_validate(attrs)
+
+    def decode_structured(self, body: Union[bytes, str]) -> BaseModel:
+        try:
+            return self.event_cls.model_validate_json(body)
+        except ValidationError:
+            return self.event_cls.model_validate(_with_data_type(
+                json.loads(body)))
+
+    def decode(self, headers: Mapping[str, str],
+               body: Union[bytes, str]) -> BaseModel:
+        content_type = headers.get('content-type', '')
+        if content_type.startswith(STRUCTURED_CONTENT_TYPE):
+            return self.decode_structured(body)
+
+        return self.decode_binary(headers, body)
+
+    def decode_batch(self, body: Union[bytes, str]) -> List[BaseModel]:
+        try:
+            return self._batch_adapter.validate_json(body)
+        except ValidationError:
+            return [
+                self.event_cls.model_validate(_with_data_type(obj))
+                for obj in json.loads(body)
+            ]
+
+    def headers(self, ev: BaseModel) -> Dict[str, str]:
+        headers = {}
+        for name, header in self._to_headers:
+            value = getattr(ev, name)
+            if value is not None:
+                headers[header] = value if type(value) is str else str(value)
+
+        return headers
+
+    def encode_binary(self,
+                      ev: BaseModel,
+                      extra_headers: dict = {},
+                      content_type: Optional[str] = None) -> Tuple[dict, bytes]:
+        """
+        Headers and body of `ev` with its data in `content_type`, JSON when
+        it is not given or its format is not available
+        """
+        headers = self.headers(ev)
+        headers['content-type'], body = self.encode_data(
+            ev.data, content_type or ev.datacontenttype)
+        if self.compression is not None and len(
+                body) >= self.compress_threshold:
+            body = self.compression.compress(body)
+            headers[ENCODING_HEADER] = self.compression.name
+        headers.update(extra_headers)
+        return (headers, body)
+
+    def decompress(self, headers: Mapping[str, str],
+                   body: Union[bytes, str]) -> Union[bytes, str]:
+        name = headers.get(ENCODING_HEADER)
+        if name is None:
+            return body
+
+        compression = compressions.get(name)
+        if compression is None:
+            raise ValueError(f"unsupported data encoding {name}")
+        if self.max_size is None:
+            return compression.decompress(body)
+
+        out = bytearray()
+        with compression.open(io.BytesIO(body)) as reader:
+            while chunk := reader.read(64 * 1024):
+                out += chunk
+                if len(out) > self.max_size:
+                    raise BodyTooLarge(
+                        f"event data larger than {self.max_size} bytes")
+        return bytes(out)
+
+    def decode_python(self, headers: Mapping[str, str],
+                      body: Union[bytes, str]) -> Any:
+        """
+        The data of a binary mode event as JSON compatible python objects,
+        without validating it
+        """
+        body = self.decompress(headers, body)
+        fmt = body_format(headers.get('content-type'))
+        if fmt is not None:
+            return fmt.loads(body)
+        return json.loads(body)
+
+    def encode_data(self,
+                    data: BaseModel,
+                    content_type: Optional[str] = None) -> Tuple[str, bytes]:
+        fmt = body_format(content_type)
+        if fmt is None:
+            return (JSON_CONTENT_TYPE, data.model_dump_json().encode())
+
+        # the fields set to None are kept, like model_dump_json() does
+        return (fmt.content_type,
+                fmt.dumps(
+                    data.__pydantic_serializer__.to_python(data,
+                                                           mode='json')))
+
+    def encode_structured(self,
+                          ev: BaseModel,
+                          extra_headers: dict = {}) -> Tuple[dict, bytes]:
+        headers = {'content-type': STRUCTURED_CONTENT_TYPE}
+        headers.update(extra_headers)
+        return (headers, ev.model_dump_json().encode())
+
+    def encode_batch(self,
+                     evs: List[BaseModel],
+                     extra_headers: dict = {}) -> Tuple[dict, bytes]:
+        headers = {'content-type': BATCH_CONTENT_TYPE}
+        headers.update(extra_headers)
+        body = b"[" + b",".join(ev.model_dump_json().encode()
+                                for ev in evs) + b"]"
+        return (headers, body)
+
+
+def _with_data_type(obj: Dict[str, Any]) -> Dict[str, Any]:
+    data = obj.get('data')
+    if isinstance(data, dict) and 'type' not in data:
+        data['type'] = obj['type']
+    return obj
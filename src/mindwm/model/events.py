@@ -1,14 +1,16 @@
-import json
-from typing import (Annotated, Any, Dict, Literal, Optional, Type, TypeVar,
-                    Union)
+import os
+from typing import (Annotated, Any, Dict, List, Literal, Optional, Type,
+                    TypeVar, Union)
 from uuid import uuid4
 
 from fastapi import Body, Request, Response
 from mindwm import logging
 from pydantic import BaseModel, Field, model_serializer
 
+from .codec import BATCH_CONTENT_TYPE, CloudEventCodec
 from .graph import (GraphObjectCreated, GraphObjectDeleted, GraphObjectUpdated,
-                    KafkaCdc)
+                    GraphTransaction, KafkaCdc)
+from .ingest import ingest
 from .objects import (IoDocument, LLMAnswer, Ping, Pong, ShowMessage, Touch,
                       TypeText, Clipboard)
 
@@ -22,7 +24,8 @@ class MindwmEvent(BaseModel):
     specversion: str = "1.0"
     data: Annotated[Union[IoDocument, Touch, LLMAnswer, ShowMessage, TypeText,
                           KafkaCdc, GraphObjectCreated, GraphObjectUpdated,
-                          GraphObjectDeleted, Ping, Pong, Clipboard],
+                          GraphObjectDeleted, GraphTransaction, Ping, Pong,
+                          Clipboard],
                     Body(discriminator="type")]
     type: str
     datacontenttype: Optional[str] = None
@@ -68,76 +71,60 @@ class MindwmEvent(BaseModel):
         return super().model_dump_json(exclude_none=True)
 
 
+codec = CloudEventCodec(
+    MindwmEvent,
+    compression=os.environ.get('EVENT_COMPRESSION'),
+    compress_threshold=int(os.environ.get('EVENT_COMPRESS_THRESHOLD', '1024')),
+    max_size=int(os.environ.get('EVENT_MAX_BODY_SIZE', str(64 * 1024 * 1024))))
+
+
 async def from_request(request: Request) -> MindwmEvent:
-    body = await request.body()
-    obj = json.loads(body)
-    ev_dict = {}
-    for k in request.headers.keys():
-        if k.startswith('ce'):
-            ev_dict[k.lstrip('ce-')] = request.headers.get(k)
-        elif k == 'traceparent':
-            ev_dict[k] = request.headers.get(k)
-
-    ev_dict['data'] = obj
-    logger.info(f"ev_dict: {ev_dict}")
-    # TODO: (@omgbebebe) should we copy a type from obj?
-    if 'type' in obj.keys():
-        ev_dict['type'] = obj['type']
-    else:
-        obj['type'] = ev_dict['type']
-
-    ev = MindwmEvent.model_validate(ev_dict)
-    return ev
+    headers, body = await ingest.read(request)
+    return codec.decode(headers, body)
+
+
+def is_batch(request: Request) -> bool:
+    return request.headers.get('content-type',
+                               '').startswith(BATCH_CONTENT_TYPE)
+
+
+async def batch_from_request(request: Request) -> List[MindwmEvent]:
+    _, body = await ingest.read(request)
+    return codec.decode_batch(body)
 
 
 def from_response(response: Response) -> MindwmEvent:
-    obj = response.json()
-    ev_dict = {}
-    for k in response.headers.keys():
-        if k.startswith('ce'):
-            ev_dict[k.lstrip('ce-')] = response.headers.get(k)
-
-    ev_dict['data'] = obj
-    logger.info(f"ev_dict: {ev_dict}")
-    # TODO: (@omgbebebe) should we copy a type from obj?
-    if 'type' in obj.keys():
-        ev_dict['type'] = obj['type']
-    else:
-        obj['type'] = ev_dict['type']
-
-    ev = MindwmEvent.model_validate(ev_dict)
-    return ev
-
-
-def to_request(ev: MindwmEvent, extra_headers: dict = {}):
-    body = ev.data
-    headers = {}
-    ev_dict = ev.model_dump()
-    to_headers = [k for k in ev_dict.keys() if k not in ['data']]
-    for h in to_headers:
-        if h == 'traceparent':
-            headers['traceparent'] = ev_dict[h]
-        else:
-            headers[f"CE-{h.capitalize()}"] = str(ev_dict[h])
-
-    #headers['content-type'] = 'application/cloudevents+json'
-    headers['content-type'] = 'application/json'
-    headers.update(extra_headers)
-    return (headers, body.model_dump_json())
-
-
-def to_response(ev: MindwmEvent, extra_headers: dict = {}) -> (Response):
-    body = ev.data
-    headers = {}
-    ev_dict = ev.model_dump()
-    to_headers = [k for k in ev_dict.keys() if k not in ['data']]
-    for h in to_headers:
-        if h == 'traceparent':
-            headers['traceparent'] = ev_dict[h]
-        else:
-            headers[f"CE-{h.capitalize()}"] = str(ev_dict[h])
-
-    #headers['content-type'] = 'application/cloudevents+json'
-    headers['content-type'] = 'application/json'
-    headers.update(extra_headers)
-    return Response(content=body.model_dump_json(), headers=headers)
+    return codec.decode(response.headers, response.content)
+
+
+def to_request(ev: MindwmEvent,
+               extra_headers: dict = {},
+               content_type: Optional[str] = None):
+    return codec.encode_binary(ev, extra_headers, content_type)
+
+
+def to_response(ev: MindwmEvent,
+                extra_headers: dict = {},
+                content_type: Optional[str] = None) -> (Response):
+    headers, body = codec.encode_binary(ev, extra_headers, content_type)
+    return Response(content=body, headers=headers)
+
+
+def to_structured_response(ev: MindwmEvent,
+                           extra_headers: dict = {}) -> (Response):
+    headers, body = codec.encode_structured(ev, extra_headers)
+    return Response(content=body, headers=headers)
+
+
+def to_batch_request(evs: List[MindwmEvent], extra_headers: dict = {}):
+    return codec.encode_batch(evs, extra_headers)
+
+
+def to_batch_response(evs: List[MindwmEvent],
+                      extra_headers: dict = {}) -> (Response):
+    headers, body = codec.encode_batch(evs, extra_headers)
+    return Response(content=body, headers=headers)
+
+
+def from_batch_response(response: Response) -> List[MindwmEvent]:
+    return codec.decode_batch(response.content)
@@ -1,12 +1,26 @@
+import os
 from datetime import datetime
+from functools import lru_cache
 from typing import (Annotated, Any, ClassVar, Dict, List, Literal, Optional,
-                    TypeVar, Union)
+                    TypeVar, Union, get_args)
 
 import mindwm.model.objects as objects
+import mindwm.model.runtime as runtime
+from mindwm.model.blobs import BlobStore
+from mindwm.model.cache import GraphCache, graph_cache
+from mindwm.model.unit_of_work import UnitOfWork
 from neontology import BaseNode, BaseRelationship
+from neontology.commonmodel import CommonModel
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
+@lru_cache(maxsize=None)
+def _prop_usage(cls, usage_type: str) -> tuple:
+    # neontology derives it from the JSON schema of the model on every
+    # instantiation, which costs milliseconds per node
+    return tuple(CommonModel._get_prop_usage.__func__(cls, usage_type))
+
+
 class MindwmNode(BaseNode):
     atime: Optional[int] = 0
     created: Optional[datetime] = None
@@ -16,6 +30,16 @@ class MindwmNode(BaseNode):
     #    default_factory=datetime.now
     #)
 
+    async def amerge(self):
+        return await runtime.run(self.merge)
+
+    async def acreate(self):
+        return await runtime.run(self.create)
+
+    @classmethod
+    def _get_prop_usage(cls, usage_type: str) -> List[str]:
+        return list(_prop_usage(cls, usage_type))
+
 
 class User(MindwmNode, objects.User):
     __primarylabel__: ClassVar[str] = "User"
@@ -82,6 +106,15 @@ class Parameter(MindwmNode, objects.Parameter):
         'org.mindwm.v1.graph.node.parameter'] = 'org.mindwm.v1.graph.node.parameter'
 
 
+class Blob(MindwmNode, objects.Blob):
+    __primarylabel__: ClassVar[str] = "Blob"
+    __primaryproperty__: ClassVar[str] = "hash"
+    type: Literal[
+        'org.mindwm.v1.graph.node.blob'] = 'org.mindwm.v1.graph.node.blob'
+    content: Optional[str] = None
+    size: Optional[int] = None
+
+
 # Relations
 class MindwmRelationship(BaseRelationship):
     traceparent: Optional[str] = None
@@ -89,6 +122,13 @@ class MindwmRelationship(BaseRelationship):
     merged: Optional[datetime] = None
     type: str
 
+    async def amerge(self):
+        return await runtime.run(self.merge)
+
+    @classmethod
+    def _get_prop_usage(cls, usage_type: str) -> List[str]:
+        return list(_prop_usage(cls, usage_type))
+
 
 class UserHasHost(MindwmRelationship):
     __relationshiptype__: ClassVar[str] = "HAS_HOST"
@@ -154,6 +194,22 @@ class IoDocumentHasUser(MindwmRelationship):
         'org.mindwm.v1.graph.relationship.iodocument_has_user'] = 'org.mindwm.v1.graph.relationship.iodocument_has_user'
 
 
+class IoDocumentHasOutput(MindwmRelationship):
+    __relationshiptype__: ClassVar[str] = "HAS_OUTPUT"
+    source: IoDocument
+    target: Blob
+    type: Literal[
+        'org.mindwm.v1.graph.relationship.iodocument_has_output'] = 'org.mindwm.v1.graph.relationship.iodocument_has_output'
+
+
+class ClipboardHasData(MindwmRelationship):
+    __relationshiptype__: ClassVar[str] = "HAS_DATA"
+    source: Clipboard
+    target: Blob
+    type: Literal[
+        'org.mindwm.v1.graph.relationship.clipboard_has_data'] = 'org.mindwm.v1.graph.relationship.clipboard_has_data'
+
+
 class UserHasParameter(MindwmRelationship):
     __relationshiptype__: ClassVar[str] = "HAS_PARAMETER"
     source: User
@@ -194,22 +250,33 @@ class TmuxPaneHasParameter(MindwmRelationship):
         'org.mindwm.v1.graph.relationship.tmuxpane_has_parameter'] = 'org.mindwm.v1.graph.relationship.tmuxpane_has_parameter'
 
 
+# large contents written once, see BlobStore; opt in with
+# UnitOfWork(blobs=blob_store)
+blob_store = BlobStore(
+    Blob, {
+        IoDocument: ('output', IoDocumentHasOutput),
+        Clipboard: ('data', ClipboardHasData),
+    },
+    min_size=int(os.environ.get('BLOB_MIN_SIZE', '256')),
+    maxsize=int(os.environ.get('BLOB_CACHE_SIZE', '100000')))
+
 # cloudvent
 # source: `org.midwm.context.cyan.knfunc.kafka_cdc
 # subject: org.mindwm.context.cyan.graph.node
 # type: 'org.mibndwm.v1.graph_change' # payload type
 
 Prop = TypeVar("Prop", User, Host, Tmux, TmuxSession, TmuxPane, IoDocument,
-               Clipboard, Parameter)
+               Clipboard, Parameter, Blob)
 
 ChangedObject = Annotated[Union[User, Host, Tmux, TmuxSession, TmuxPane,
-                                IoDocument, Clipboard, Parameter, UserHasHost,
-                                HostHasTmux, HostHasClipboard,
+                                IoDocument, Clipboard, Parameter, Blob,
+                                UserHasHost, HostHasTmux, HostHasClipboard,
                                 HostHasParameter, TmuxHasTmuxSession,
                                 TmuxHasParameter, TmuxSessionHasTmuxPane,
                                 TmuxSessionHasParameter, TmuxPaneHasIoDocument,
                                 TmuxPaneHasParameter, IoDocumentHasUser,
-                                TmuxPaneHasIoDocument, UserHasTmux],
+                                TmuxPaneHasIoDocument, UserHasTmux,
+                                IoDocumentHasOutput, ClipboardHasData],
                           Field(discriminator='type')]
 
 
@@ -231,6 +298,22 @@ class GraphObjectDeleted(BaseModel):
     obj: ChangedObject
 
 
+GraphChange = Annotated[Union[GraphObjectCreated, GraphObjectUpdated,
+                              GraphObjectDeleted],
+                        Field(discriminator='type')]
+
+
+class GraphTransaction(BaseModel):
+    """
+    The graph changes of one Neo4j transaction, in the order they were
+    made. `complete` is unset when some of them never arrived in time.
+    """
+    type: Literal['org.mindwm.v1.graph.transaction'] = 'org.mindwm.v1.graph.transaction'
+    tx_id: int
+    complete: bool = True
+    changes: List[GraphChange]
+
+
 # kafka-source cdc events
 class KafkaCdcMeta(BaseModel):
     timestamp: int
@@ -309,48 +392,57 @@ class KafkaCdc(BaseModel):
                 return self.get_object_before()
 
 
+_node_types = {
+    cls.model_fields['type'].default: cls
+    for cls in Prop.__constraints__
+}
+_relationship_types = {
+    cls.model_fields['type'].default: cls
+    for cls in get_args(get_args(ChangedObject)[0])
+    if issubclass(cls, MindwmRelationship)
+}
+_changed_types = {
+    'created': GraphObjectCreated,
+    'updated': GraphObjectUpdated,
+    'deleted': GraphObjectDeleted,
+}
+
+
+def _rel_node(node: KafkaCdcRelNode) -> MindwmNode:
+    node_type = f"org.mindwm.v1.graph.node.{node.labels[0].lower()}"
+    if node_type not in _node_types:
+        raise ValueError(f"unknown node type {node_type}")
+    return _node_types[node_type].model_validate(node.ids)
+
+
 class GraphObjectChanged(BaseModel):
 
     @classmethod
     def from_kafka_cdc(self, cdc: KafkaCdc):
+        """
+        The graph change of a CDC record, built from the already validated
+        payload: the node itself, or a relationship between the nodes
+        identified by the ids of its ends
+        """
         match cdc.payload.type:
             case 'node':
                 if cdc.meta.operation == 'deleted':
-                    obj_payload = cdc.payload.before
+                    obj = cdc.payload.before.properties
                 else:
-                    obj_payload = cdc.payload.after
-
-                label = obj_payload.labels[0].lower()
-                props = obj_payload.properties
-                obj_dict = {
-                    "type": f"org.mindwm.v1.graph.{cdc.meta.operation}",
-                    "obj": props.model_dump(),
-                }
+                    obj = cdc.payload.after.properties
 
             case 'relationship':
                 start_label = cdc.payload.start.labels[0].lower()
-                start_ids = cdc.payload.start.ids
-                start_node = {
-                    "type": f"org.mindwm.v1.graph.node.{start_label}"
-                } | start_ids
-                end_label = cdc.payload.end.labels[0].lower()
-                end_ids = cdc.payload.end.ids
-                end_node = {
-                    "type": f"org.mindwm.v1.graph.node.{end_label}"
-                } | end_ids
                 obj_type = f"org.mindwm.v1.graph.relationship.{start_label}_{cdc.payload.label.lower()}"
-                obj_dict = {
-                    "type": f"org.mindwm.v1.graph.{cdc.meta.operation}",
-                    "obj": {
-                        "source": start_node,
-                        "target": end_node,
-                        "type": obj_type,
-                    }
-                }
-        match cdc.meta.operation:
-            case 'created':
-                return GraphObjectCreated.model_validate(obj_dict)
-            case 'updated':
-                return GraphObjectUpdated.model_validate(obj_dict)
-            case 'deleted':
-                return GraphObjectDeleted.model_validate(obj_dict)
+                if obj_type not in _relationship_types:
+                    raise ValueError(f"unknown relationship type {obj_type}")
+                obj = _relationship_types[obj_type].model_validate({
+                    'source': _rel_node(cdc.payload.start),
+                    'target': _rel_node(cdc.payload.end),
+                })
+
+        return _changed_types[cdc.meta.operation].model_construct(obj=obj)
+
+    @classmethod
+    def from_kafka_cdc_batch(self, cdcs: List[KafkaCdc]) -> list:
+        return [self.from_kafka_cdc(cdc) for cdc in cdcs]
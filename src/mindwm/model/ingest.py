@@ -0,0 +1,439 @@
+import asyncio
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import suppress
+from typing import BinaryIO, List, Mapping, Optional, TextIO, Tuple
+from uuid import uuid4
+
+from fastapi import Request
+from mindwm import logging
+
+from .codec import ENCODING_HEADER, BodyTooLarge, body_format, compressions
+
+logger = logging.getLogger(__name__)
+
+TRUNCATE = 'truncate'
+REFERENCE = 'reference'
+POLICIES = (TRUNCATE, REFERENCE)
+
+REF_SCHEME = 'spill:'
+CHUNK_SIZE = 64 * 1024
+
+_STRUCTURE = re.compile(rb'["{}\[\],:]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+_HIGH_SURROGATE = re.compile(rb'\\u[dD][89abAB][0-9a-fA-F]{2}')
+
+
+def _escape_start(data: bytes, p: int) -> bool:
+    # a backslash preceded by an even number of backslashes
+    q = p - 1
+    while q >= 0 and data[q] == 0x5c:
+        q -= 1
+    return (p - 1 - q) % 2 == 0
+
+
+def _safe_cut(data: bytes, limit: int) -> int:
+    """
+    Greatest position up to `limit` in the content of a JSON string which
+    splits neither a character, an escape sequence nor a surrogate pair
+    """
+    cut = max(min(limit, len(data)), 0)
+    while 0 < cut < len(data) and 0x80 <= data[cut] < 0xc0:
+        cut -= 1
+    for p in range(max(cut - 5, 0), cut):
+        if data[p] == 0x5c and _escape_start(data, p):
+            length = 6 if data[p + 1:p + 2] == b'u' else 2
+            if p + length > cut:
+                cut = p
+                break
+    if cut >= 6 and _HIGH_SURROGATE.fullmatch(
+            data, cut - 6, cut) and _escape_start(data, cut - 6):
+        cut -= 6
+    return cut
+
+
+def _decode_string(raw: BinaryIO, out: TextIO):
+    """
+    Write the text of the JSON string content in `raw`, piece by piece
+    """
+    raw.seek(0)
+    tail = b""
+    while chunk := raw.read(CHUNK_SIZE):
+        data = tail + chunk
+        cut = _safe_cut(data, len(data) - 12)
+        out.write(json.loads(b'"' + data[:cut] + b'"'))
+        tail = data[cut:]
+    if tail:
+        out.write(json.loads(b'"' + tail + b'"'))
+
+
+class _Rewriter:
+    """
+    Copies a JSON document chunk by chunk, cutting the strings longer than
+    `field_max` bytes. With a `ref_dir` the text of a cut member of an
+    object is saved there and referenced by a `<member>_ref` next to it.
+    """
+
+    def __init__(self,
+                 field_max: int,
+                 ref_dir: Optional[str] = None,
+                 refs: Optional[List[str]] = None):
+        self.field_max = field_max
+        self.ref_dir = ref_dir
+        self.out = bytearray()
+        self.refs: List[str] = [] if refs is None else refs
+        self.truncated = 0
+        self._objects: List[bool] = []
+        self._expect_key = False
+        self._key = b""
+        self._in_string = False
+        self._is_key = False
+        self._escape = False
+        self._start = 0
+        self._length = 0
+        self._overflow = False
+        self._sink: Optional[BinaryIO] = None
+
+    def feed(self, chunk: bytes):
+        pos = 0
+        while pos < len(chunk):
+            if self._in_string:
+                pos = self._string(chunk, pos)
+                continue
+
+            m = _STRUCTURE.search(chunk, pos)
+            if m is None:
+                self.out += chunk[pos:]
+                return
+            self.out += chunk[pos:m.start()]
+            self._structure(chunk[m.start()])
+            pos = m.end()
+
+    def _structure(self, c: int):
+        if c == 0x22:  # "
+            self._in_string = True
+            self._is_key = bool(self._objects and self._objects[-1]
+                                and self._expect_key)
+            self._length = 0
+            self.out.append(c)
+            self._start = len(self.out)
+            return
+
+        if c == 0x7b:  # {
+            self._objects.append(True)
+            self._expect_key = True
+        elif c == 0x5b:  # [
+            self._objects.append(False)
+            self._expect_key = False
+        elif c in (0x7d, 0x5d):  # } ]
+            if self._objects:
+                self._objects.pop()
+        elif c == 0x2c:  # ,
+            self._expect_key = bool(self._objects and self._objects[-1])
+        elif c == 0x3a:  # :
+            self._expect_key = False
+        self.out.append(c)
+
+    def _string(self, chunk: bytes, pos: int) -> int:
+        while pos < len(chunk):
+            if self._escape:
+                self._escape = False
+                self._take(chunk[pos:pos + 1])
+                pos += 1
+                continue
+
+            m = _STRING_SPECIAL.search(chunk, pos)
+            if m is None:
+                self._take(chunk[pos:])
+                return len(chunk)
+            self._take(chunk[pos:m.start()])
+            if chunk[m.start()] == 0x5c:
+                self._take(b'\\')
+                self._escape = True
+                pos = m.end()
+            else:
+                self._end_string()
+                return m.end()
+
+        return pos
+
+    def _take(self, data: bytes):
+        if self._overflow:
+            if self._sink is not None:
+                self._sink.write(data)
+            return
+
+        self.out += data
+        self._length += len(data)
+        if not self._is_key and self._length > self.field_max:
+            content = self.out[self._start:]
+            cut = _safe_cut(content, self.field_max)
+            del self.out[self._start + cut:]
+            self._overflow = True
+            self.truncated += 1
+            if self.ref_dir is not None:
+                self._sink = tempfile.TemporaryFile(dir=self.ref_dir)
+                self._sink.write(content)
+
+    def _end_string(self):
+        if self._is_key:
+            self._key = bytes(self.out[self._start:])
+        self.out.append(0x22)
+        self._in_string = False
+        if not self._overflow:
+            return
+
+        self._overflow = False
+        if self._sink is None:
+            return
+
+        with self._sink:
+            if self._objects and self._objects[-1]:
+                ref = self._save(self._sink)
+                self.out += b',"' + self._key + b'_ref":"' + ref.encode(
+                ) + b'"'
+            self._sink = None
+
+    def _save(self, raw: BinaryIO) -> str:
+        name = uuid4().hex
+        with open(os.path.join(self.ref_dir, name), 'w',
+                  encoding='utf-8') as out:
+            _decode_string(raw, out)
+        ref = f"{REF_SCHEME}{name}"
+        self.refs.append(ref)
+        return ref
+
+
+class Ingest:
+    """
+    Reads the bodies of the events with bounded memory.
+
+    A body larger than `max_size` bytes, once decompressed, is refused. A
+    JSON body larger than `spill_threshold` is spooled to a temporary file
+    instead of memory and rewritten with its strings longer than
+    `field_max` bytes cut to that length, so what is validated stays
+    small. With the `reference` policy the whole text of a cut string is
+    kept in `spill_dir` too, referenced by the `<field>_ref` next to it,
+    e.g. IoDocument.output_ref.
+
+    The files of the references live as long as the request they were
+    read from: they are removed when the last `hold` of the request is
+    released, unless a handler called `keep` for them.
+    """
+
+    def __init__(self,
+                 max_size: int = 64 * 1024 * 1024,
+                 spill_threshold: int = 1024 * 1024,
+                 field_max: int = 256 * 1024,
+                 policy: str = TRUNCATE,
+                 spill_dir: Optional[str] = None):
+        if policy not in POLICIES:
+            raise ValueError(
+                f"unknown oversize policy {policy}, expected one of {POLICIES}"
+            )
+        self.max_size = max_size
+        self.spill_threshold = spill_threshold
+        self.field_max = field_max
+        self.policy = policy
+        self.spill_dir = spill_dir or tempfile.gettempdir()
+        self.requests = 0
+        self.spilled = 0
+        self.truncated = 0
+        self.refused = 0
+        self.removed = 0
+        self._kept: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _check(self, size: int):
+        if size > self.max_size:
+            self.refused += 1
+            raise BodyTooLarge(
+                f"event body larger than {self.max_size} bytes")
+
+    async def read(self, request: Request) -> Tuple[Mapping[str, str], bytes]:
+        """
+        Headers and bounded body of the event `request`, read once
+        """
+        cached = getattr(request.state, 'event_body', None)
+        if cached is not None:
+            return cached
+
+        self.requests += 1
+        headers = request.headers
+        refs: List[str] = []
+        request.state.spill_refs = refs
+        chunks: Optional[List[bytes]] = []
+        spool = None
+        size = 0
+        try:
+            async for chunk in request.stream():
+                size += len(chunk)
+                self._check(size)
+                if spool is None and size > self.spill_threshold:
+                    spool = tempfile.TemporaryFile(dir=self.spill_dir)
+                    spool.writelines(chunks)
+                    chunks = None
+                if spool is None:
+                    chunks.append(chunk)
+                else:
+                    spool.write(chunk)
+
+            if spool is None and ENCODING_HEADER not in headers:
+                result = (headers, b"".join(chunks))
+            else:
+                body = spool if spool is not None else io.BytesIO(
+                    b"".join(chunks))
+                result = await asyncio.to_thread(self.bound, headers, body,
+                                                 refs)
+        finally:
+            if spool is not None:
+                spool.close()
+
+        request.state.event_body = result
+        return result
+
+    def bound(
+            self,
+            headers: Mapping[str, str],
+            body: BinaryIO,
+            refs: Optional[List[str]] = None
+    ) -> Tuple[Mapping[str, str], bytes]:
+        """
+        Decompress and rewrite a spooled or compressed body, the references
+        of the fields cut are appended to `refs`
+        """
+        encoding = headers.get(ENCODING_HEADER)
+        if encoding is None:
+            return headers, self._rewrite(headers, body, refs)
+
+        compression = compressions.get(encoding)
+        if compression is None:
+            raise ValueError(f"unsupported data encoding {encoding}")
+        headers = {k: v for k, v in headers.items() if k != ENCODING_HEADER}
+        body.seek(0)
+        chunks = []
+        spool = None
+        size = 0
+        try:
+            with compression.open(body) as reader:
+                while chunk := reader.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    self._check(size)
+                    if spool is None and size > self.spill_threshold:
+                        spool = tempfile.TemporaryFile(dir=self.spill_dir)
+                        spool.writelines(chunks)
+                    if spool is None:
+                        chunks.append(chunk)
+                    else:
+                        spool.write(chunk)
+
+            if spool is None:
+                return headers, b"".join(chunks)
+            return headers, self._rewrite(headers, spool, refs)
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def _rewrite(self,
+                 headers: Mapping[str, str],
+                 spool: BinaryIO,
+                 refs: Optional[List[str]] = None) -> bytes:
+        self.spilled += 1
+        spool.seek(0)
+        if body_format(headers.get('content-type')) is not None:
+            # not JSON, only bounded by max_size
+            return spool.read()
+
+        rewriter = _Rewriter(
+            self.field_max,
+            self.spill_dir if self.policy == REFERENCE else None, refs)
+        while chunk := spool.read(CHUNK_SIZE):
+            rewriter.feed(chunk)
+        if rewriter.truncated:
+            self.truncated += rewriter.truncated
+            logger.info(
+                f"{rewriter.truncated} fields of a {spool.tell()} bytes event cut to {self.field_max} bytes"
+            )
+        return bytes(rewriter.out)
+
+    def hold(self, request: Request):
+        """
+        Keep the files of the references read from `request` until a
+        matching `release`
+        """
+        request.state.spill_holds = getattr(request.state, 'spill_holds',
+                                            0) + 1
+
+    def release(self, request: Request):
+        holds = getattr(request.state, 'spill_holds', 1) - 1
+        request.state.spill_holds = holds
+        if holds > 0:
+            return
+
+        for ref in getattr(request.state, 'spill_refs', ()):
+            with self._lock:
+                if ref in self._kept:
+                    self._kept.discard(ref)
+                    continue
+            with suppress(FileNotFoundError):
+                os.unlink(self.path(ref))
+                self.removed += 1
+
+    def path(self, ref: str) -> str:
+        if not ref.startswith(REF_SCHEME):
+            raise ValueError(f"not a spilled field reference: {ref}")
+        return os.path.join(self.spill_dir, ref[len(REF_SCHEME):])
+
+    def keep(self, ref: str):
+        """
+        Leave the file of `ref` in place when its request is over, to be
+        removed with `remove_reference`
+        """
+        with self._lock:
+            self._kept.add(ref)
+
+    def stats(self) -> dict:
+        return {
+            'max_size': self.max_size,
+            'spill_threshold': self.spill_threshold,
+            'field_max': self.field_max,
+            'policy': self.policy,
+            'requests': self.requests,
+            'spilled': self.spilled,
+            'truncated': self.truncated,
+            'refused': self.refused,
+            'removed': self.removed,
+        }
+
+
+def reference_path(ref: str) -> str:
+    return ingest.path(ref)
+
+
+def open_reference(ref: str) -> TextIO:
+    """
+    The whole text of a field cut by the `reference` policy
+    """
+    return open(reference_path(ref), encoding='utf-8')
+
+
+def keep_reference(ref: str):
+    ingest.keep(ref)
+
+
+def remove_reference(ref: str):
+    with suppress(FileNotFoundError):
+        os.unlink(reference_path(ref))
+
+
+ingest = Ingest(
+    max_size=int(os.environ.get('EVENT_MAX_BODY_SIZE', str(64 * 1024 * 1024))),
+    spill_threshold=int(
+        os.environ.get('EVENT_SPILL_THRESHOLD', str(1024 * 1024))),
+    field_max=int(os.environ.get('EVENT_FIELD_MAX', str(256 * 1024))),
+    policy=os.environ.get('EVENT_OVERSIZE_POLICY', TRUNCATE),
+    spill_dir=os.environ.get('EVENT_SPILL_DIR'))
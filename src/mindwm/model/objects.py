@@ -8,7 +8,7 @@ from pydantic_core.core_schema import ValidatorFunctionWrapHandler
 
 class MindwmObject(BaseModel):
     _subclasses: ClassVar[dict[str, type[Any]]] = {}
-    _discriminating_type_adapter: ClassVar[TypeAdapter]
+    _discriminating_type_adapter: ClassVar[Optional[TypeAdapter]] = None
     traceparent: Optional[str] = None
     tracestate: Optional[str] = None
 
@@ -18,18 +18,30 @@ class MindwmObject(BaseModel):
             cls, v: Any,
             handler: ValidatorFunctionWrapHandler) -> 'MindwmObject':
         if cls is MindwmObject:
-            return MindwmObject._discriminating_type_adapter.validate_python(v)
+            if isinstance(v, dict):
+                subclass = MindwmObject._subclasses.get(v.get('type'))
+                if subclass is not None:
+                    return subclass.__pydantic_validator__.validate_python(v)
+            # anything else gets the errors of the discriminated union
+            return MindwmObject.type_adapter().validate_python(v)
         return handler(v)
 
     @classmethod
     def __pydantic_init_subclass__(cls, **kwargs):
         MindwmObject._subclasses[cls.model_fields['type'].default] = cls
+        MindwmObject._discriminating_type_adapter = None
 
-        # The following will create a new type adapter every time a new subclass is created,
-        # which is fine if there aren't that many classes (as far as performance goes)
-        MindwmObject._discriminating_type_adapter = TypeAdapter(
-            Annotated[Union[tuple(MindwmObject._subclasses.values())],
-                      Field(discriminator='type')])
+    @staticmethod
+    def type_adapter() -> TypeAdapter:
+        """
+        Adapter of the union of all the subclasses discriminated by `type`,
+        built on first use once the subclasses are defined
+        """
+        if MindwmObject._discriminating_type_adapter is None:
+            MindwmObject._discriminating_type_adapter = TypeAdapter(
+                Annotated[Union[tuple(MindwmObject._subclasses.values())],
+                          Field(discriminator='type')])
+        return MindwmObject._discriminating_type_adapter
 
     def to_json(self):
         return self.model_dump_json()
@@ -52,6 +64,10 @@ class IoDocument(MindwmObject):
                       default_factory=lambda: uuid4().hex)
     input: str
     output: str
+    # the whole output when it was cut on ingestion, see model.ingest
+    output_ref: Optional[str] = None
+    # the output stored in the graph, see model.blobs
+    output_blob: Optional[str] = None
     ps1: str
     type: Literal['org.mindwm.v1.iodocument'] = 'org.mindwm.v1.iodocument'
 
@@ -72,6 +88,8 @@ class Clipboard(MindwmObject):
     uuid: str
     time: int
     data: str
+    data_ref: Optional[str] = None
+    data_blob: Optional[str] = None
     type: Literal['org.mindwm.v1.clipboard'] = 'org.mindwm.v1.clipboard'
 
 
@@ -144,3 +162,10 @@ class TmuxSession(MindwmObject):
 class TmuxPane(MindwmObject):
     title: str  # f"{username}@{hostname}/{socket_path}:{tmux_session}%{pane}"
     type: Literal['org.mindwm.v1.tmux_pane'] = 'org.mindwm.v1.tmux_pane'
+
+
+class Blob(MindwmObject):
+    hash: str  # sha256 of the content
+    content: str
+    size: int
+    type: Literal['org.mindwm.v1.blob'] = 'org.mindwm.v1.blob'
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from mindwm import logging
+from neo4j import GraphDatabase
+from neontology import GraphConnection, init_neontology
+from neontology.utils import get_node_types
+
+logger = logging.getLogger(__name__)
+
+
+class GraphRuntime:
+    """
+    Process-lifetime Neo4j connection shared by all handlers.
+
+    The driver pool is opened and the constraints for the nodes from
+    `mindwm.model.graph` are applied once. A failed initialization is
+    retried not more often than `retry_interval` seconds.
+    """
+
+    def __init__(self):
+        self.uri = os.environ.get('NEO4J_URI')
+        self.username = os.environ.get('NEO4J_USERNAME')
+        self.password = os.environ.get('NEO4J_PASSWORD')
+        self.pool_size = int(
+            os.environ.get('NEO4J_MAX_CONNECTION_POOL_SIZE', '100'))
+        self.acquisition_timeout = float(
+            os.environ.get('NEO4J_CONNECTION_ACQUISITION_TIMEOUT', '60'))
+        self.retry_interval = float(
+            os.environ.get('NEO4J_INIT_RETRY_INTERVAL', '5'))
+        self.executor_workers = int(
+            os.environ.get('NEO4J_EXECUTOR_WORKERS', '8'))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Future] = None
+        self.required = False
+        self.state = 'uninitialized'
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self._last_attempt = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == 'ready'
+
+    def init(self) -> bool:
+        if self.state == 'ready':
+            return True
+
+        with self._lock:
+            if self.state == 'ready':
+                return True
+            if self._last_attempt is not None and monotonic(
+            ) - self._last_attempt < self.retry_interval:
+                return False
+
+            self._last_attempt = monotonic()
+            self.attempts += 1
+            try:
+                self._connect()
+                self._constrain()
+            except Exception as e:
+                logger.error(f"failed to initialize graph runtime: {e}")
+                self.state = 'failed'
+                self.error = str(e)
+                return False
+
+            logger.info(f"graph runtime is ready: {self.uri}")
+            self.state = 'ready'
+            self.error = None
+            return True
+
+    def init_background(self):
+        """
+        Start init() on the executor without waiting for it, once at a time
+        """
+        if self.ready or (self._pending is not None
+                          and not self._pending.done()):
+            return
+        self._pending = self.executor.submit(self.init)
+
+    def _connect(self):
+        init_neontology(self.uri, self.username, self.password)
+        # GraphConnection() would retry without credentials after a failure
+        connection = GraphConnection._instance
+        if connection is None:
+            raise ConnectionError(f"unable to connect to {self.uri}")
+
+        # neontology opens the driver with the default pool settings,
+        # replace it with the configured one for the whole process
+        connection.driver.close()
+        connection.driver = GraphDatabase.driver(
+            self.uri,
+            auth=(self.username, self.password),
+            max_connection_pool_size=self.pool_size,
+            connection_acquisition_timeout=self.acquisition_timeout)
+        connection.driver.verify_connectivity()
+
+    def _constrain(self):
+        from mindwm.model.graph import MindwmNode
+
+        connection = GraphConnection()
+        for label, node_type in get_node_types(MindwmNode).items():
+            connection.apply_constraint(label, node_type.__primaryproperty__)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.executor_workers,
+                        thread_name_prefix='neo4j')
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking graph call on the executor, off the event loop
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          partial(fn, *args, **kwargs))
+
+    def health(self) -> dict:
+        return {
+            'state': self.state,
+            'error': self.error,
+            'attempts': self.attempts,
+            'uri': self.uri,
+            'pool_size': self.pool_size,
+            'acquisition_timeout': self.acquisition_timeout,
+            'executor_workers': self.executor_workers,
+        }
+
+    def close(self):
+        with self._lock:
+            if self.state == 'ready':
+                GraphConnection().driver.close()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self.state = 'uninitialized'
+            self._last_attempt = None
+
+
+_runtime = GraphRuntime()
+
+
+def require():
+    """
+    Mark the graph as needed by a handler so readiness depends on it
+    """
+    _runtime.required = True
+
+
+def required() -> bool:
+    return _runtime.required
+
+
+def init() -> bool:
+    return _runtime.init()
+
+
+def init_background():
+    _runtime.init_background()
+
+
+def ready() -> bool:
+    return not _runtime.required or _runtime.ready
+
+
+async def run(fn: Callable, *args, **kwargs) -> Any:
+    return await _runtime.run(fn, *args, **kwargs)
+
+
+def health() -> dict:
+    return _runtime.health()
+
+
+def close():
+    _runtime.close()
@@ -0,0 +1,197 @@
+from typing import (TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple,
+                    TypeVar, Union)
+
+import mindwm.model.runtime as runtime
+from mindwm import logging
+from mindwm.model.cache import GraphCache, node_key
+from neontology import BaseNode, BaseRelationship, GraphConnection
+
+if TYPE_CHECKING:
+    from mindwm.model.blobs import BlobStore
+
+logger = logging.getLogger(__name__)
+
+GraphObject = TypeVar("GraphObject", BaseNode, BaseRelationship)
+
+
+class UnitOfWork:
+    """
+    Collects nodes and relationships and writes all of them to the graph
+    in one query, with an UNWIND subquery per object type and operation.
+
+        with graph.UnitOfWork() as uow:
+            user = uow.merge(graph.User(username=username))
+            host = uow.merge(graph.Host(hostname=hostname))
+            uow.merge(graph.UserHasHost(source=user, target=host))
+
+    `merge` and `create` keep the semantics of the neontology methods with
+    the same names. Nodes are written before relationships, so the
+    relationships may connect nodes from the same unit of work. Used
+    with `async with`, the flush runs off the event loop.
+
+    With a `cache`, merges of objects already known to exist are skipped
+    and the nodes written by `flush` are remembered, with the
+    relationships between two of them. With a BlobStore as `blobs`, the
+    large contents of the nodes it knows are written to the graph once,
+    as blobs the nodes refer to.
+    """
+
+    def __init__(self,
+                 cache: Optional[GraphCache] = None,
+                 blobs: Optional['BlobStore'] = None):
+        self.cache = cache
+        self.blobs = blobs
+        self._nodes: Dict[tuple, List[BaseNode]] = {}
+        self._rels: Dict[tuple, List[BaseRelationship]] = {}
+        self._flushed: List[Callable[[], Any]] = []
+
+    def __len__(self) -> int:
+        return sum(map(len, self._nodes.values())) + sum(
+            map(len, self._rels.values()))
+
+    def __enter__(self) -> 'UnitOfWork':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    async def __aenter__(self) -> 'UnitOfWork':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.aflush()
+
+    def merge(self, obj: GraphObject) -> GraphObject:
+        if self.cache is not None and obj in self.cache:
+            return obj
+        self._add('MERGE', obj)
+        return obj
+
+    def create(self, obj: GraphObject) -> GraphObject:
+        self._add('CREATE', obj)
+        return obj
+
+    def after_flush(self, callback: Callable[[], Any]):
+        """
+        Call `callback` once the objects collected so far are written
+        """
+        self._flushed.append(callback)
+
+    def _add(self, op: str, obj: Union[BaseNode, BaseRelationship]):
+        if isinstance(obj, BaseNode):
+            if self.blobs is not None:
+                self.blobs.offload(self, obj)
+            self._nodes.setdefault((op, type(obj)), []).append(obj)
+        elif isinstance(obj, BaseRelationship):
+            key = (op, type(obj), type(obj.source), type(obj.target))
+            self._rels.setdefault(key, []).append(obj)
+        else:
+            raise TypeError(f"not a graph object: {type(obj)}")
+
+    def compile(self) -> Tuple[str, Dict[str, Any]]:
+        subqueries = []
+        params = {}
+        for key, objs in [*self._nodes.items(), *self._rels.items()]:
+            name = f"batch{len(params)}"
+            if len(key) == 2:
+                cypher, rows = _node_subquery(name, *key, objs)
+            else:
+                cypher, rows = _rel_subquery(name, *key, objs)
+            subqueries.append(f"CALL {{\n{cypher}\n}}")
+            params[name] = rows
+
+        return "\n".join(subqueries), params
+
+    def flush(self):
+        if not len(self):
+            return
+
+        cypher, params = self.compile()
+        logger.debug(f"flush {len(self)} graph objects: {cypher}")
+        GraphConnection().cypher_write(cypher, params)
+        if self.cache is not None:
+            written = set()
+            for objs in self._nodes.values():
+                for node in objs:
+                    self.cache.add(node)
+                    written.add(node_key(node))
+            # the MATCH of a relationship may find no end and write nothing
+            for objs in self._rels.values():
+                for rel in objs:
+                    if node_key(rel.source) in written and node_key(
+                            rel.target) in written:
+                        self.cache.add(rel)
+        for callback in self._flushed:
+            callback()
+        self._nodes.clear()
+        self._rels.clear()
+        self._flushed.clear()
+
+    async def aflush(self):
+        await runtime.run(self.flush)
+
+
+def _labels(cls) -> str:
+    return ":".join([cls.__primarylabel__] + cls.__secondarylabels__)
+
+
+def _node_subquery(name: str, op: str, cls,
+                   nodes: List[BaseNode]) -> Tuple[str, list]:
+    pp = cls.__primaryproperty__
+    if op == 'MERGE':
+        rows = [n._get_merge_parameters() for n in nodes]
+        cypher = f"""
+        UNWIND ${name} AS row
+        MERGE (n:{_labels(cls)} {{ {pp}: row.pp }})
+        ON MATCH SET n += row.set_on_match
+        ON CREATE SET n += row.set_on_create
+        SET n += row.always_set
+        """
+    else:
+        rows = []
+        for n in nodes:
+            all_props = n.neo4j_dict()
+            rows.append({"pp": all_props.pop(pp), "all_props": all_props})
+        cypher = f"""
+        UNWIND ${name} AS row
+        CREATE (n:{_labels(cls)} {{ {pp}: row.pp }})
+        SET n += row.all_props
+        """
+
+    return cypher, rows
+
+
+def _rel_subquery(name: str, op: str, cls, source_cls, target_cls,
+                  rels: List[BaseRelationship]) -> Tuple[str, list]:
+    source_pp = source_cls.__primaryproperty__
+    target_pp = target_cls.__primaryproperty__
+    match = f"""
+        UNWIND ${name} AS row
+        MATCH (source:{source_cls.__primarylabel__} {{ {source_pp}: row.source_prop }}),
+            (target:{target_cls.__primarylabel__} {{ {target_pp}: row.target_prop }})"""
+    rel_type = cls.get_relationship_type()
+    if op == 'MERGE':
+        rows = [r._get_merge_parameters(source_pp, target_pp) for r in rels]
+        merge_on = ", ".join(
+            [f"{x}: row.{x}" for x in cls._get_prop_usage("merge_on")])
+        merge_on = f" {{ {merge_on} }}" if merge_on else ""
+        cypher = f"""{match}
+        MERGE (source)-[r:{rel_type}{merge_on}]->(target)
+        ON MATCH SET r += row.set_on_match
+        ON CREATE SET r += row.set_on_create
+        SET r += row.always_set
+        """
+    else:
+        rows = [{
+            "source_prop": r.source.neo4j_dict()[source_pp],
+            "target_prop": r.target.neo4j_dict()[target_pp],
+            "all_props": r.neo4j_dict(exclude={"source", "target"}),
+        } for r in rels]
+        cypher = f"""{match}
+        CREATE (source)-[r:{rel_type}]->(target)
+        SET r += row.all_props
+        """
+
+    return cypher, rows
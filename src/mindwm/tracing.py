@@ -0,0 +1,164 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+from mindwm import logging
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace.propagation import set_span_in_context
+from opentelemetry.trace.propagation.tracecontext import \
+    TraceContextTextMapPropagator
+
+logger = logging.getLogger(__name__)
+
+FULL = 'full'
+PROPAGATE = 'propagate'
+OFF = 'off'
+MODES = (FULL, PROPAGATE, OFF)
+
+TRACE_HEADERS = ('traceparent', 'tracestate')
+
+propagator = TraceContextTextMapPropagator()
+_mode: Optional[str] = None
+_exporters: List = []
+
+
+def configure(mode: Optional[str] = None,
+              sampler=None,
+              exporters: Optional[List] = None,
+              service_name: Optional[str] = None) -> str:
+    """
+    Set up tracing once per process, the first call wins.
+
+    TRACING_MODE selects the mode:
+      full       SDK spans, sampled and exported (default)
+      propagate  no spans, the incoming traceparent/tracestate is forwarded
+      off        no spans and nothing is forwarded
+
+    The sampler comes from the standard OTEL_TRACES_SAMPLER and
+    OTEL_TRACES_SAMPLER_ARG (e.g. `parentbased_traceidratio` and `0.1`)
+    and the exporters from OTEL_TRACES_EXPORTER, a comma separated list of
+    `otlp`, `console` or `none` (default `otlp`).
+    """
+    global _mode
+    if _mode is not None:
+        return _mode
+
+    mode = mode or os.environ.get('TRACING_MODE', FULL)
+    if mode not in MODES:
+        raise ValueError(f"unknown tracing mode {mode}, expected one of {MODES}")
+
+    if mode == FULL:
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        attributes = {SERVICE_NAME: service_name} if service_name else {}
+        provider = TracerProvider(sampler=sampler,
+                                  resource=Resource.create(attributes))
+        if exporters is None:
+            exporters = _exporters_from_env()
+        for exporter in exporters:
+            provider.add_span_processor(BatchSpanProcessor(exporter))
+        _exporters.extend(exporters)
+        trace.set_tracer_provider(provider)
+
+    logger.info(f"tracing mode: {mode}")
+    _mode = mode
+    return mode
+
+
+def mode() -> str:
+    return _mode or configure()
+
+
+def warmup():
+    """
+    Set the exporters up before the first span is exported
+    """
+    for exporter in _exporters:
+        if isinstance(exporter, _LazyOTLPSpanExporter):
+            exporter._get()
+
+
+def _exporters_from_env() -> List:
+    exporters = []
+    for name in os.environ.get('OTEL_TRACES_EXPORTER', 'otlp').split(','):
+        name = name.strip()
+        if name == 'otlp':
+            exporters.append(_LazyOTLPSpanExporter())
+        elif name == 'console':
+            from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+            exporters.append(ConsoleSpanExporter())
+        elif name not in ('none', ''):
+            logger.warning(f"unknown trace exporter {name}, ignored")
+
+    return exporters
+
+
+class _LazyOTLPSpanExporter(SpanExporter):
+    """
+    OTLP exporter imported, together with grpc, on the first export from
+    the span processor thread rather than at startup
+    """
+
+    def __init__(self):
+        self._exporter = None
+
+    def _get(self) -> SpanExporter:
+        if self._exporter is None:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import \
+                OTLPSpanExporter
+            self._exporter = OTLPSpanExporter()
+        return self._exporter
+
+    def export(self, spans):
+        try:
+            exporter = self._get()
+        except RuntimeError as e:
+            # nothing was exported before the interpreter began to exit,
+            # too late to set the exporter up
+            logger.warning(f"{len(spans)} spans dropped: {e}")
+            return SpanExportResult.FAILURE
+        return exporter.export(spans)
+
+    def shutdown(self):
+        if self._exporter is not None:
+            self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        if self._exporter is None:
+            return True
+        return self._exporter.force_flush(timeout_millis)
+
+
+def trace_headers(carrier: Optional[Mapping[str, str]]) -> dict:
+    if not carrier:
+        return {}
+    return {k: carrier[k] for k in TRACE_HEADERS if k in carrier}
+
+
+@contextmanager
+def start_span(tracer: trace.Tracer,
+               name: str,
+               carrier: Optional[Mapping[str, str]] = None
+               ) -> Iterator[Tuple[trace.Span, dict]]:
+    """
+    Span continuing the trace of `carrier`, or of the current span when
+    there is no carrier. Yields the span and the trace headers to send
+    downstream.
+
+    In `propagate` mode no span is created: a non-recording span is
+    yielded along with the trace headers of `carrier` as they are.
+    """
+    current = mode()
+    if current == FULL:
+        ctx = propagator.extract(carrier) if carrier is not None else None
+        with tracer.start_as_current_span(name, context=ctx) as span:
+            headers = {}
+            propagator.inject(headers, set_span_in_context(span))
+            yield span, headers
+    elif current == PROPAGATE:
+        yield trace.INVALID_SPAN, trace_headers(carrier)
+    else:
+        yield trace.INVALID_SPAN, {}
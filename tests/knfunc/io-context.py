@@ -1,6 +1,9 @@
+from typing import Union
+
+import mindwm.model.graph as graphModel
 from mindwm import logging
 from mindwm.model.objects import IoDocument
-from mindwm.knfunc.decorators import iodoc, app
+from mindwm.knfunc.decorators import event, iodoc, app
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -19,29 +22,41 @@ async def func(
     logger.debug(f"received: {iodocument}")
     logger.debug(f"socket_path: {socket_path}")
 
-    user = graph.User(username=username).merge()
-    host = graph.Host(hostname=hostname).merge()
-
-    socket_path = socket_path.strip("b'").strip('/')
-    socket_path = f"{username}@{hostname}/{socket_path}"
-    tmux = graph.Tmux(socket_path=socket_path).merge()
-
-    session_id = f"{socket_path}:{tmux_session}"
-    sess = graph.TmuxSession(name=session_id).merge()
-
-    tmux_pane = f"{session_id}%{tmux_pane}"
-    pane = graph.TmuxPane(title=tmux_pane).merge()
-
-    iodoc = graph.IoDocument(
-            uuid=uuid,
-            input=iodocument.input,
-            output=iodocument.output,
-            ps1=iodocument.ps1
-        ).create()
-    graph.UserHasHost(source=user, target=host).merge()
-    graph.HostHasTmux(source=host, target=tmux).merge()
-    graph.TmuxHasTmuxSession(source=tmux, target=sess).merge()
-    graph.UserHasTmux(source=user, target=tmux).merge()
-    graph.TmuxSessionHasTmuxPane(source=sess, target=pane).merge()
-    graph.TmuxPaneHasIoDocument(source=pane, target=iodoc).merge()
-    graph.IoDocumentHasUser(source=iodoc, target=user).merge()
+    async with graph.UnitOfWork(cache=graph.graph_cache,
+                                blobs=graph.blob_store) as uow:
+        user = uow.merge(graph.User(username=username))
+        host = uow.merge(graph.Host(hostname=hostname))
+
+        socket_path = socket_path.strip("b'").strip('/')
+        socket_path = f"{username}@{hostname}/{socket_path}"
+        tmux = uow.merge(graph.Tmux(socket_path=socket_path))
+
+        session_id = f"{socket_path}:{tmux_session}"
+        sess = uow.merge(graph.TmuxSession(name=session_id))
+
+        tmux_pane = f"{session_id}%{tmux_pane}"
+        pane = uow.merge(graph.TmuxPane(title=tmux_pane))
+
+        iodoc = uow.create(
+            graph.IoDocument(uuid=uuid,
+                             input=iodocument.input,
+                             output=iodocument.output,
+                             ps1=iodocument.ps1))
+        uow.merge(graph.UserHasHost(source=user, target=host))
+        uow.merge(graph.HostHasTmux(source=host, target=tmux))
+        uow.merge(graph.TmuxHasTmuxSession(source=tmux, target=sess))
+        uow.merge(graph.UserHasTmux(source=user, target=tmux))
+        uow.merge(graph.TmuxSessionHasTmuxPane(source=sess, target=pane))
+        uow.merge(graph.TmuxPaneHasIoDocument(source=pane, target=iodoc))
+        uow.merge(graph.IoDocumentHasUser(source=iodoc, target=user))
+
+
+@event
+async def graph_changed(changed: Union[graphModel.GraphObjectDeleted,
+                                       graphModel.GraphTransaction]):
+    # the caches must not keep what was deleted from the graph
+    changes = changed.changes if isinstance(
+        changed, graphModel.GraphTransaction) else [changed]
+    for c in changes:
+        graphModel.graph_cache.observe(c)
+        graphModel.blob_store.observe(c)
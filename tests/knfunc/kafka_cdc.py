@@ -1,24 +1,104 @@
+import asyncio
+import os
+import urllib.request
+
 import mindwm.model.graph as graph
 from mindwm import logging
 from mindwm.knfunc.decorators import Request, Response, app, event
+from mindwm.model.cdc import GraphChange, cdc_coalescer, cdc_transactions
 from mindwm.model.events import (KafkaCdc, MindwmEvent, from_request,
+                                 to_batch_request, to_batch_response,
                                  to_response)
 
 logger = logging.getLogger(__name__)
 
+# the incomplete transactions and the coalesced updates found by the
+# timers are POSTed to the sink of the function when it has one, or
+# replied with the next record
+sink = os.environ.get('K_SINK')
+held: list[MindwmEvent] = []
+
+
+def transaction_event(tx: graph.GraphTransaction, kind: str) -> MindwmEvent:
+    return MindwmEvent(
+        source=f"org.mindwm.context.cyan.knfunc.kafka_cdc",
+        subject=f"org.mindwm.context.cyan.graph.{kind}",
+        type=tx.type,
+        data=tx,
+        traceparent=tx.changes[0].obj.traceparent,
+    )
+
+
+def change_event(change: GraphChange) -> MindwmEvent:
+    return MindwmEvent(
+        source=f"org.mindwm.context.cyan.knfunc.kafka_cdc",
+        subject=f"org.mindwm.context.cyan.graph.change",
+        type=change.type,
+        data=change,
+        traceparent=change.obj.traceparent,
+    )
+
+
+def post(evs: list[MindwmEvent]):
+    headers, body = to_batch_request(evs)
+    req = urllib.request.Request(sink, data=body, headers=headers)
+    with urllib.request.urlopen(req, timeout=10):
+        pass
+
+
+async def forward(evs: list[MindwmEvent]):
+    if sink is None:
+        held.extend(evs)
+        return
+    try:
+        await asyncio.to_thread(post, evs)
+    except Exception:
+        held.extend(evs)
+        raise
+
+
+async def forward_expired(txs: list[graph.GraphTransaction]):
+    await forward([transaction_event(tx, 'transaction') for tx in txs])
+
+
+async def forward_due(changes: list[GraphChange]):
+    await forward([change_event(c) for c in changes])
+
+
+async def start_sweep():
+    asyncio.create_task(cdc_transactions.sweep(forward_expired),
+                        name='cdc-transactions-sweep')
+    asyncio.create_task(cdc_coalescer.sweep(forward_due),
+                        name='cdc-coalescer-sweep')
+
+
+app.router.on_startup.append(start_sweep)
+
 
 @event
 async def func(obj: KafkaCdc, request: Request, response: Response):
     logger.info(obj)
-    cdc_ev = await from_request(request)
-    res = graph.GraphObjectChanged.from_kafka_cdc(cdc_ev.data)
+    tx = cdc_transactions.add(obj)
+    expired = cdc_transactions.expired()
+    for e in expired:
+        logger.warning(f"incomplete transaction {e.tx_id} forwarded")
 
-    new_ev = MindwmEvent(
-        source=f"org.mindwm.context.cyan.knfunc.kafka_cdc",
-        subject=f"org.mindwm.context.cyan.graph.{cdc_ev.data.payload.type}",
-        type=res.type,
-        data=res,
-        traceparent=res.obj.traceparent,
-    )
-    resp = to_response(new_ev)
-    return resp
+    evs = held + [transaction_event(e, 'transaction') for e in expired]
+    held.clear()
+    if tx is not None and len(tx.changes) == 1:
+        # the updates of an object within CDC_COALESCE_WINDOW go as the last
+        change = cdc_coalescer.add(tx.changes[0])
+        evs += [change_event(c) for c in cdc_coalescer.due()]
+        if change is not None:
+            evs.append(change_event(change))
+    elif tx is not None:
+        # the updates held go first, the transaction may change them again
+        evs += [change_event(c) for c in cdc_coalescer.due(flush=True)]
+        evs.append(transaction_event(tx, obj.payload.type))
+
+    if not evs:
+        # more records of the transaction, or more updates, are to come
+        return Response(status_code=200)
+    if len(evs) == 1:
+        return to_response(evs[0])
+    return to_batch_response(evs)
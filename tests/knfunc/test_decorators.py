@@ -0,0 +1,83 @@
+import mindwm.model.runtime as graphRuntime
+from fastapi.testclient import TestClient
+from mindwm.knfunc.decorators import (Dispatch, _iodoc_injectors, app,
+                                      dispatch_plan, event, inject,
+                                      llm_answer, source_identity, warm)
+from mindwm.model.events import MindwmEvent, codec, from_response
+from mindwm.model.objects import (IoDocument, LLMAnswer, Ping, Pong,
+                                  ShowMessage)
+
+base_source = "org.mindwm.alice.laptop.tmux.L3RtcC90bXV4LTEwMDAvZGVmYXVsdA==.e3f65957-a3d9-7c45-13b7-9e0a4c61bc0c.23.36"
+
+
+async def handler(iodocument: IoDocument, uuid: str, username: str,
+                  pane_title: str, unknown: str = None):
+    pass
+
+
+def test_source_identity():
+    identity = source_identity(base_source)
+    assert identity.username == "alice"
+    assert identity.hostname == "laptop"
+    assert identity.socket_path == "alice@laptop/tmp/tmux-1000/default"
+    assert identity.session_id == "alice@laptop/tmp/tmux-1000/default:23"
+    assert identity.pane_title == "alice@laptop/tmp/tmux-1000/default:23%36"
+
+
+def test_dispatch_plan():
+    plan = dispatch_plan(handler, _iodoc_injectors)
+    assert [name for name, _ in plan
+            ] == ['iodocument', 'uuid', 'username', 'pane_title']
+
+    iodoc = IoDocument(input="uptime", output="up", ps1="$")
+    ev = MindwmEvent(source=base_source, data=iodoc, type=iodoc.type)
+    kwargs = inject(plan, Dispatch(None, event=ev, obj=iodoc))
+    assert kwargs == {
+        'iodocument': iodoc,
+        'uuid': iodoc.uuid,
+        'username': 'alice',
+        'pane_title': 'alice@laptop/tmp/tmux-1000/default:23%36',
+    }
+
+
+@llm_answer
+async def show_answer(answer: LLMAnswer):
+    return ShowMessage(title=answer.codesnippet,
+                       message=answer.description,
+                       parent_uuid=answer.iodoc_uuid,
+                       targets=["a"])
+
+
+def test_structured_llm_answer():
+    answer = LLMAnswer(iodoc_uuid="1", codesnippet="ls", description="list")
+    ev = MindwmEvent(source=base_source, data=answer, type=answer.type)
+    (headers, body) = codec.encode_structured(ev)
+    resp = TestClient(app).post("/", headers=headers, content=body)
+    assert resp.status_code == 200
+    assert from_response(resp).data.message == "list"
+
+
+def test_readiness_retries_the_graph(monkeypatch):
+    runtime = graphRuntime._runtime
+    monkeypatch.setattr(runtime, 'required', True)
+    monkeypatch.setattr(runtime, 'state', 'failed')
+    monkeypatch.setattr(runtime, '_last_attempt', None)
+    monkeypatch.setattr(runtime, '_connect', lambda: None)
+    monkeypatch.setattr(runtime, '_constrain', lambda: None)
+    monkeypatch.setattr(warm, 'done', True)
+    assert TestClient(app).get("/health/readiness").status_code == 200
+
+
+@event
+async def pong(ping: Ping):
+    return Pong(uuid=ping.uuid)
+
+
+def test_structured_event_reply():
+    ping = Ping()
+    ev = MindwmEvent(source=base_source, data=ping, type=ping.type)
+    (headers, body) = codec.encode_structured(ev)
+    resp = TestClient(app).post("/", headers=headers, content=body)
+    assert resp.status_code == 200
+    reply = from_response(resp)
+    assert (reply.subject, reply.data.uuid) == (base_source, ping.uuid)
@@ -0,0 +1,63 @@
+from fastapi import Response
+from fastapi.testclient import TestClient
+from mindwm.knfunc.decorators import app, event
+from mindwm.knfunc.dedup import DedupCache, duplicate_reply
+from mindwm.model.events import (MindwmEvent, from_batch_response,
+                                 to_batch_request)
+from mindwm.model.objects import Pong, Touch
+
+
+def test_duplicate_gets_first_reply():
+    cache = DedupCache("test")
+    assert cache.claim(("src", "1")) is None
+    cache.complete(("src", "1"), Response(content=b"pong", status_code=200))
+    reply = cache.claim(("src", "1"))
+    assert duplicate_reply(reply).body == b"pong"
+    assert cache.claim(("src", "2")) is None
+    assert cache.stats()['duplicate_rate'] == 1 / 3
+
+
+def test_in_flight_and_release():
+    cache = DedupCache("test", cache_replies=False)
+    assert cache.claim("1") is None
+    # the first delivery may still fail, the broker has to retry
+    reply = duplicate_reply(cache.claim("1"))
+    assert (reply.status_code, reply.headers['retry-after']) == (429, '1')
+    cache.release("1")
+    assert cache.claim("1") is None
+    cache.complete("1", Response(content=b"pong"))
+    assert duplicate_reply(cache.claim("1")).status_code == 200
+
+
+def test_window_and_size():
+    cache = DedupCache("test", maxsize=1, window=0)
+    assert cache.claim("1") is None
+    assert cache.claim("1") is None
+    cache = DedupCache("test", maxsize=1)
+    cache.claim("1")
+    cache.claim("2")
+    assert cache.claim("1") is None
+
+
+runs = []
+
+
+@event(dedup=True)
+async def touched(touch: Touch):
+    runs.append(touch.ids)
+    return Pong(uuid=str(touch.ids[0]))
+
+
+def test_redelivered_batch_gets_first_reply():
+    evs = [
+        MindwmEvent(source="src", data=Touch(ids=[i]), type=Touch(ids=[i]).type)
+        for i in range(2)
+    ]
+    (headers, body) = to_batch_request(evs)
+    client = TestClient(app)
+    first = client.post("/", headers=headers, content=body)
+    again = client.post("/", headers=headers, content=body)
+    assert runs == [[0], [1]]
+    assert again.status_code == 200
+    assert [ev.data.uuid for ev in from_batch_response(again)] == ["0", "1"]
+    assert again.content == first.content
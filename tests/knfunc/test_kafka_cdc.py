@@ -5,6 +5,8 @@ import mindwm.model.graph as graph
 import mindwm.model.objects as objects
 from fastapi.testclient import TestClient
 
+from mindwm.model.cdc import cdc_coalescer, cdc_transactions
+
 from .kafka_cdc import app
 
 client = TestClient(app)
@@ -146,7 +148,9 @@ kafka_cdc_events = {
 }
 
 
-def test_kafka_cdc():
+def test_kafka_cdc(monkeypatch):
+    # the updates are not held back
+    monkeypatch.setattr(cdc_coalescer, 'window', 0)
     for k, v in kafka_cdc_events.items():
         ev = events.MindwmEvent(data=v, type=v.type)
         mindwm_cdc = graph.GraphObjectChanged.from_kafka_cdc(v)
@@ -155,3 +159,43 @@ def test_kafka_cdc():
         assert response.status_code == 200
         resp = events.from_response(response)
         resp_cdc = resp.data
+
+
+def test_kafka_cdc_batch():
+    cdcs = list(kafka_cdc_events.values())
+    changed = graph.GraphObjectChanged.from_kafka_cdc_batch(cdcs)
+    assert [c.type for c in changed] == [
+        f"org.mindwm.v1.graph.{cdc.meta.operation}" for cdc in cdcs
+    ]
+    assert changed[0].obj == cdcs[0].payload.after.properties
+    assert type(changed[1].obj) is graph.UserHasHost
+    assert changed[1].obj.target.hostname == 'wrkeys'
+    for c in changed:
+        assert type(c).model_validate_json(c.model_dump_json()) == c
+
+
+def test_incomplete_transaction_is_forwarded(monkeypatch):
+    monkeypatch.setattr(cdc_transactions, 'timeout', 0)
+    cdc = kafka_cdc_events["user"].model_copy(deep=True)
+    cdc.meta.txId, cdc.meta.txEventsCount = 1000, 2
+    ev = events.MindwmEvent(data=cdc, type=cdc.type)
+    (headers, body) = events.to_request(ev)
+    response = client.post("/", headers=headers, content=body)
+    tx = events.from_response(response).data
+    assert (tx.tx_id, tx.complete, len(tx.changes)) == (1000, False, 1)
+
+
+def test_updates_are_coalesced(monkeypatch):
+    monkeypatch.setattr(cdc_coalescer, 'window', 60)
+    cdc = kafka_cdc_events["user"].model_copy(deep=True)
+    cdc.payload.after.properties.username = 'coalesced'
+    for atime in range(3):
+        cdc.meta.txId = 2000 + atime
+        cdc.payload.after.properties.atime = atime
+        ev = events.MindwmEvent(data=cdc, type=cdc.type)
+        (headers, body) = events.to_request(ev)
+        response = client.post("/", headers=headers, content=body)
+        assert (response.status_code, response.content) == (200, b"")
+
+    [change] = cdc_coalescer.due(flush=True)
+    assert (change.obj.username, change.obj.atime) == ('coalesced', 2)
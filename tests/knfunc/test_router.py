@@ -0,0 +1,75 @@
+from typing import Union
+
+import mindwm.model.events as events
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+from mindwm.knfunc.router import Router, payload_types
+from mindwm.model.ingest import ingest
+from mindwm.model.objects import Ping, Pong, Touch
+
+router = Router()
+app = FastAPI()
+app.post('/')(router.dispatch)
+client = TestClient(app)
+
+
+async def ping(request, response):
+    return Response(content="ping")
+
+
+async def touch(request, response):
+    return Response(content="touch")
+
+
+router.add(ping, ['org.mindwm.v1.ping'])
+router.add(touch, ['org.mindwm.v1.touch'])
+
+
+def test_payload_types():
+
+    async def f(obj: Union[Ping, Pong], request):
+        pass
+
+    assert payload_types(f) == ['org.mindwm.v1.ping', 'org.mindwm.v1.pong']
+
+
+def test_route_by_type():
+    for obj, expected in [(Ping(), "ping"), (Touch(ids=[1]), "touch")]:
+        ev = events.MindwmEvent(source="src", data=obj, type=obj.type)
+        (headers, body) = events.to_request(ev)
+        assert client.post("/", headers=headers,
+                           content=body).text == expected
+        (headers, body) = events.codec.encode_structured(ev)
+        assert client.post("/", headers=headers,
+                           content=body).text == expected
+        (headers, body) = events.to_batch_request([ev, ev])
+        assert client.post("/", headers=headers,
+                           content=body).text == expected
+
+
+def test_unknown_type():
+    ev = events.MindwmEvent(data=Pong(uuid="1"), type="org.mindwm.v1.pong")
+    (headers, body) = events.to_request(ev)
+    assert client.post("/", headers=headers, content=body).status_code == 400
+
+
+def test_too_large_event(monkeypatch):
+    monkeypatch.setattr(ingest, 'max_size', 10)
+    ev = events.MindwmEvent(source="src", data=Ping(), type=Ping().type)
+    (headers, body) = events.codec.encode_structured(ev)
+    assert client.post("/", headers=headers,
+                       content=body).status_code == 413
+
+
+def test_spilled_fields_go_with_the_request(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest, 'spill_threshold', 10)
+    monkeypatch.setattr(ingest, 'field_max', 40)
+    monkeypatch.setattr(ingest, 'policy', 'reference')
+    monkeypatch.setattr(ingest, 'spill_dir', str(tmp_path))
+    ping = Ping(payload="x" * 100)
+    ev = events.MindwmEvent(source="src", data=ping, type=ping.type)
+    (headers, body) = events.codec.encode_structured(ev)
+    removed = ingest.stats()['removed']
+    assert client.post("/", headers=headers, content=body).text == "ping"
+    assert ingest.stats()['removed'] == removed + 1
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,41 @@
+import asyncio
+
+from fastapi import Response
+from mindwm.knfunc.decorators import iodoc, router, warm
+from mindwm.knfunc.warmup import WARMUP_SOURCE, Warmup
+from mindwm.model.events import from_request
+from mindwm.model.objects import IoDocument, Ping
+
+
+def test_synthetic_events_are_dispatched():
+    received = []
+
+    async def dispatch(request, response):
+        received.append(await from_request(request))
+        return Response(status_code=500)
+
+    warm = Warmup()
+    warm.add(Ping(payload="warm"))
+    assert not warm.done
+    asyncio.run(warm.run(dispatch))
+
+    assert warm.done
+    assert [(ev.source, ev.data.payload)
+            for ev in received] == [(WARMUP_SOURCE, "warm")]
+    assert warm.stats()['errors'] == {
+        'event org.mindwm.v1.ping': 'status 500'
+    }
+
+
+def test_iodoc_warmup():
+    received = []
+
+    @iodoc(warmup=IoDocument(input="true", output="", ps1="$"))
+    async def handler(iodocument: IoDocument, pane_title: str):
+        received.append((iodocument.input, pane_title))
+
+    run = Warmup()
+    run.events = [warm.events[-1]]
+    asyncio.run(run.run(router.dispatch))
+    assert run.stats()['errors'] == {}
+    assert received == [("true", "knfunc@warmup/tmp/knfunc-warmup:0%0")]
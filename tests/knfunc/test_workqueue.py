@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from mindwm.knfunc.workqueue import WorkQueue
+
+
+def test_backpressure_and_drain():
+    done = []
+
+    async def main():
+        queue = WorkQueue("test", maxsize=2, workers=1)
+        release = asyncio.Event()
+
+        async def job(i):
+            await release.wait()
+            done.append(i)
+
+        # the first job is taken by the worker, two more fill the queue
+        assert queue.submit(lambda: job(0))
+        await asyncio.sleep(0)
+        assert queue.submit(lambda: job(1))
+        assert queue.submit(lambda: job(2))
+        assert not queue.submit(lambda: job(3))
+        assert queue.stats()['depth'] == 2
+        assert queue.utilization == 1.0
+
+        release.set()
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert done == [0, 1, 2]
+    assert stats['accepted'] == 3
+    assert stats['rejected'] == 1
+    assert stats['processed'] == 3
+
+
+def test_workers_are_required():
+    with pytest.raises(ValueError):
+        WorkQueue("test", workers=0)
@@ -0,0 +1,68 @@
+import hashlib
+
+import mindwm.model.graph as graph
+import mindwm.model.unit_of_work as unit_of_work
+from mindwm.model.ingest import ingest
+
+output = "NAME READY STATUS\n" + "pod-1 1/1 Running\n" * 20
+
+
+class FakeConnection:
+    writes = []
+
+    def cypher_write(self, cypher, params):
+        self.writes.append((cypher, params))
+
+
+def iodoc(uuid: str, output: str = output):
+    return graph.IoDocument(uuid=uuid, input="kubectl get pods", output=output)
+
+
+def test_output_is_written_once(monkeypatch):
+    monkeypatch.setattr(unit_of_work, 'GraphConnection', FakeConnection)
+    store = graph.BlobStore(
+        graph.Blob, {graph.IoDocument: ('output', graph.IoDocumentHasOutput)},
+        min_size=100)
+
+    with graph.UnitOfWork(blobs=store) as uow:
+        doc = uow.create(iodoc("1"))
+        uow.create(iodoc("2", output="short"))
+        cypher, params = uow.compile()
+
+    digest = hashlib.sha256(output.encode()).hexdigest()
+    assert doc.output is None
+    assert doc.output_blob == f"blob:{digest}"
+    assert "MERGE (n:Blob { hash: row.pp })" in cypher
+    assert "MERGE (source)-[r:HAS_OUTPUT]->(target)" in cypher
+    assert [row['pp'] for rows in params.values() for row in rows
+            if row.get('pp') == digest] == [digest]
+    assert len(store) == 1
+
+    with graph.UnitOfWork(blobs=store) as uow:
+        again = uow.create(iodoc("3"))
+        cypher, _ = uow.compile()
+
+    assert again.output_blob == doc.output_blob
+    assert "MERGE (n:Blob" not in cypher
+    assert store.stats()['deduplicated'] == 1
+
+    store.observe(graph.GraphObjectDeleted(obj=graph.Blob(hash=digest)))
+    assert len(store) == 0
+
+
+def test_spilled_output_is_stored_whole(monkeypatch, tmp_path):
+    monkeypatch.setattr(unit_of_work, 'GraphConnection', FakeConnection)
+    monkeypatch.setattr(ingest, 'spill_dir', str(tmp_path))
+    (tmp_path / "spilled").write_text(output)
+    store = graph.BlobStore(
+        graph.Blob, {graph.IoDocument: ('output', graph.IoDocumentHasOutput)},
+        min_size=100)
+
+    with graph.UnitOfWork(blobs=store) as uow:
+        doc = iodoc("1", output=output[:10])
+        doc.output_ref = "spill:spilled"
+        uow.create(doc)
+
+    digest = hashlib.sha256(output.encode()).hexdigest()
+    assert (doc.output_blob, doc.output_ref) == (f"blob:{digest}", None)
+    assert not (tmp_path / "spilled").exists()
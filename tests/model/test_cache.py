@@ -0,0 +1,75 @@
+import mindwm.model.graph as graph
+import mindwm.model.unit_of_work as unit_of_work
+
+
+def test_cache_hit_miss():
+    cache = graph.GraphCache(maxsize=2)
+    user = graph.User(username="alice")
+    assert user not in cache
+    cache.add(user)
+    assert graph.User(username="alice") in cache
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_cache_lru_ttl():
+    cache = graph.GraphCache(maxsize=2)
+    cache.add(graph.User(username="alice"))
+    cache.add(graph.Host(hostname="laptop"))
+    cache.add(graph.User(username="bob"))
+    assert graph.User(username="alice") not in cache
+    assert cache.stats()['evictions'] == 1
+
+    expired = graph.GraphCache(ttl=0)
+    expired.add(graph.User(username="alice"))
+    assert graph.User(username="alice") not in expired
+    assert len(expired) == 0
+
+
+def test_cache_invalidate_deleted_node():
+    cache = graph.GraphCache()
+    user = graph.User(username="alice")
+    host = graph.Host(hostname="laptop")
+    cache.add(user)
+    cache.add(host)
+    cache.add(graph.UserHasHost(source=user, target=host))
+    cache.observe(graph.GraphObjectDeleted(obj=user))
+    assert user not in cache
+    assert graph.UserHasHost(source=user, target=host) not in cache
+    assert host in cache
+
+
+def test_unit_of_work_skips_cached_merges():
+    cache = graph.GraphCache()
+    user = graph.User(username="alice")
+    cache.add(user)
+    uow = graph.UnitOfWork(cache=cache)
+    uow.merge(user)
+    uow.merge(graph.Host(hostname="laptop"))
+    uow.create(graph.IoDocument(uuid="1", input="", output="", ps1=""))
+    assert len(uow) == 2
+
+
+def test_unit_of_work_caches_relationships_it_matched(monkeypatch):
+
+    class FakeConnection:
+
+        def cypher_write(self, cypher, params):
+            pass
+
+    monkeypatch.setattr(unit_of_work, 'GraphConnection', FakeConnection)
+    cache = graph.GraphCache()
+    user = graph.User(username="alice")
+    cache.add(user)
+    host = graph.Host(hostname="laptop")
+    tmux = graph.Tmux(socket_path="alice@laptop/tmp/tmux-1000/default")
+    with graph.UnitOfWork(cache=cache) as uow:
+        uow.merge(user)
+        uow.merge(host)
+        uow.merge(tmux)
+        uow.merge(graph.UserHasHost(source=user, target=host))
+        uow.merge(graph.HostHasTmux(source=host, target=tmux))
+
+    # alice may be gone since she was cached, HAS_HOST may not be written
+    assert graph.UserHasHost(source=user, target=host) not in cache
+    assert graph.HostHasTmux(source=host, target=tmux) in cache
@@ -0,0 +1,104 @@
+import asyncio
+
+import mindwm.model.graph as graph
+from mindwm.model.cdc import CdcCoalescer, CdcTransactions
+
+
+def cdc(tx_id: int,
+        event_id: int,
+        count: int,
+        username: str,
+        operation: str = 'created',
+        atime: int = 0):
+    return graph.KafkaCdc(
+        meta=graph.KafkaCdcMeta(timestamp=1724929112463,
+                                username='neo4j',
+                                txId=tx_id,
+                                txEventId=event_id,
+                                txEventsCount=count,
+                                operation=operation,
+                                source={'hostname': 'cyan-neo4j-0'}),
+        payload=graph.KafkaCdcNode(
+            id=event_id,
+            before=graph.KafkaCdcNodeData(
+                properties=graph.User(username=username), labels=['User']),
+            after=graph.KafkaCdcNodeData(properties=graph.User(
+                username=username, atime=atime),
+                                         labels=['User'])),
+        cdc_schema=graph.KafkaCdcSchema(properties={}, constraints=[]))
+
+
+def test_transaction_is_reassembled_in_order():
+    txs = CdcTransactions(timeout=60)
+    assert txs.add(cdc(1, 1, 2, 'bob')) is None
+    tx = txs.add(cdc(1, 0, 2, 'alice'))
+    assert tx.tx_id == 1 and tx.complete
+    assert [c.obj.username for c in tx.changes] == ['alice', 'bob']
+    assert len(txs) == 0 and txs.buffered == 0
+
+
+def test_incomplete_transactions_are_given_up():
+    txs = CdcTransactions(timeout=60, max_records=2)
+    txs.add(cdc(1, 0, 3, 'alice'))
+    txs.add(cdc(2, 0, 2, 'bob'))
+    # the third record is over the cap, the oldest transaction goes
+    txs.add(cdc(3, 0, 2, 'carol'))
+    assert [(tx.tx_id, tx.complete) for tx in txs.expired()] == [(1, False)]
+    assert txs.stats()['evicted'] == 1
+
+    txs = CdcTransactions(timeout=0)
+    txs.add(cdc(1, 0, 2, 'alice'))
+    assert [(tx.tx_id, tx.complete) for tx in txs.expired()] == [(1, False)]
+    assert txs.stats()['timed_out'] == 1 and txs.buffered == 0
+
+
+def test_expired_transactions_are_swept():
+    txs = CdcTransactions(timeout=0)
+    swept = []
+
+    async def emit(expired):
+        swept.extend(expired)
+
+    async def run():
+        txs.add(cdc(1, 0, 2, 'alice'))
+        task = asyncio.create_task(txs.sweep(emit, interval=0.01))
+        while not swept:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert [(tx.tx_id, tx.complete) for tx in swept] == [(1, False)]
+
+
+def test_updates_are_coalesced():
+    coalescer = CdcCoalescer(window=0)
+    assert coalescer.add(cdc(1, 0, 1, 'alice')).type.endswith('created')
+    for atime in range(1, 4):
+        assert coalescer.add(cdc(1, 0, 1, 'alice', 'updated', atime)) is None
+    assert coalescer.add(cdc(1, 0, 1, 'bob', 'updated', 1)) is None
+    assert coalescer.add(cdc(1, 0, 1, 'bob', 'deleted')) is not None
+    assert [(c.obj.username, c.obj.atime)
+            for c in coalescer.due()] == [('alice', 3)]
+    assert coalescer.stats()['coalesced'] == 3
+
+    coalescer = CdcCoalescer(window=60)
+    coalescer.add(cdc(1, 0, 1, 'alice', 'updated', 1))
+    assert coalescer.due() == []
+
+
+def test_held_updates_are_swept():
+    coalescer = CdcCoalescer(window=0)
+    swept = []
+
+    async def emit(changes):
+        swept.extend(changes)
+
+    async def run():
+        coalescer.add(cdc(1, 0, 1, 'alice', 'updated', 1))
+        task = asyncio.create_task(coalescer.sweep(emit))
+        while not swept:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert [(c.obj.username, c.obj.atime) for c in swept] == [('alice', 1)]
@@ -0,0 +1,107 @@
+import mindwm.model.events as events
+import pytest
+from mindwm.model.codec import (CBOR_CONTENT_TYPE, ENCODING_HEADER,
+                                JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE,
+                                STRUCTURED_CONTENT_TYPE, BodyTooLarge,
+                                CloudEventCodec, formats)
+from mindwm.model.objects import IoDocument
+
+from test_cdc import cdc
+from test_objects import models
+
+
+def test_binary_data_without_type():
+    headers = {'ce-id': '1', 'ce-source': 'src', 'ce-type': 'org.mindwm.v1.ping'}
+    ev = events.codec.decode(headers, b'{"payload": "1234567890", "uuid": "1"}')
+    assert ev.type == 'org.mindwm.v1.ping'
+    assert ev.data == models['ping'].model_copy(update={'uuid': '1'})
+
+
+def test_binary_data_with_own_type():
+    headers = {'ce-id': '1', 'ce-type': 'org.mindwm.v1.graph_change'}
+    ev = events.codec.decode(headers, models['touch'].model_dump_json())
+    assert ev.type == 'org.mindwm.v1.touch'
+    assert ev.data == models['touch']
+
+
+def test_structured_isomorphism():
+    for k in ['iodoc', 'clipboard', 'llm_answer']:
+        ev = events.MindwmEvent(source="src", data=models[k], type=models[k].type)
+        (headers, body) = events.codec.encode_structured(ev)
+        assert headers['content-type'] == STRUCTURED_CONTENT_TYPE
+        assert events.codec.decode(headers, body) == ev
+
+
+@pytest.mark.parametrize("content_type",
+                         [MSGPACK_CONTENT_TYPE, CBOR_CONTENT_TYPE])
+def test_binary_formats_isomorphism(content_type):
+    if content_type not in formats:
+        pytest.skip(f"{content_type} is not available")
+
+    for data in models.values():
+        (ct, body) = events.codec.encode_data(data, content_type)
+        assert ct == content_type
+        assert events.codec.decode_model(type(data), {'content-type': ct},
+                                         body) == data
+
+    for k in [
+            'iodoc', 'touch', 'llm_answer', 'ping', 'pong', 'show_message',
+            'type_text', 'clipboard'
+    ]:
+        ev = events.MindwmEvent(source="src", data=models[k], type=models[k].type)
+        (headers, body) = events.to_request(ev, content_type=content_type)
+        headers = {k.lower(): v for k, v in headers.items()}
+        assert events.codec.decode(headers, body) == ev
+
+    for atime in [0, None]:
+        ev = events.MindwmEvent(source="src",
+                                data=cdc(1, 0, 1, 'alice', atime=atime),
+                                type='dev.knative.kafka.event')
+        (headers, body) = events.to_request(ev, content_type=content_type)
+        headers = {k.lower(): v for k, v in headers.items()}
+        assert events.codec.decode(headers, body) == ev
+
+
+def test_unknown_format_falls_back_to_json():
+    ev = events.MindwmEvent(source="src",
+                            data=models['ping'],
+                            type=models['ping'].type)
+    (headers, body) = events.to_request(ev, content_type='application/x-nope')
+    assert headers['content-type'] == JSON_CONTENT_TYPE
+    headers = {k.lower(): v for k, v in headers.items()}
+    assert events.codec.decode(headers, body) == ev
+
+
+def test_compression():
+    codec = CloudEventCodec(events.MindwmEvent,
+                            compression='gzip',
+                            compress_threshold=256)
+    ev = events.MindwmEvent(source="src",
+                            data=models['iodoc'],
+                            type=models['iodoc'].type)
+    (headers, body) = codec.encode_binary(ev)
+    assert ENCODING_HEADER not in headers
+
+    iodoc = models['iodoc'].model_copy(update={'output': "drwxr-xr-x .\n" * 100})
+    ev = events.MindwmEvent(source="src", data=iodoc, type=iodoc.type)
+    (headers, body) = codec.encode_binary(ev)
+    headers = {k.lower(): v for k, v in headers.items()}
+    assert headers[ENCODING_HEADER] == 'gzip'
+    assert len(body) < len(iodoc.output) / 5
+    assert codec.decode(headers, body) == ev
+    # any codec decodes it, compressing or not
+    assert events.codec.decode(headers, body) == ev
+
+
+def test_decompression_is_bounded():
+    codec = CloudEventCodec(events.MindwmEvent,
+                            compression='gzip',
+                            compress_threshold=0,
+                            max_size=1000)
+    doc = IoDocument(input="yes", output="y\n" * 100000, ps1="$")
+    ev = events.MindwmEvent(source="src", data=doc, type=doc.type)
+    (headers, body) = codec.encode_binary(ev)
+    headers = {k.lower(): v for k, v in headers.items()}
+    assert len(body) < 1000
+    with pytest.raises(BodyTooLarge):
+        codec.decode(headers, body)
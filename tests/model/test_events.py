@@ -37,6 +37,12 @@ async def process_event(req: Request):
     return events.to_response(ev)
 
 
+@app.post('/batch')
+async def process_batch(req: Request):
+    evs = await events.batch_from_request(req)
+    return events.to_batch_response(evs)
+
+
 client = TestClient(app)
 
 
@@ -47,3 +53,12 @@ def test_conversion_isomorphism():
         assert response.status_code == 200
         obj = events.from_response(response)
         assert obj == v
+
+
+def test_batch_isomorphism():
+    evs_list = list(evs.values()) * 3
+    (headers, body) = events.to_batch_request(evs_list)
+    response = client.post("/batch", headers=headers, content=body)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == events.BATCH_CONTENT_TYPE
+    assert events.from_batch_response(response) == evs_list
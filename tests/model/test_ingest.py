@@ -0,0 +1,132 @@
+import asyncio
+import gzip
+import json
+import os
+
+import pytest
+from mindwm.model.codec import ENCODING_HEADER
+from mindwm.model.events import MindwmEvent, codec
+from mindwm.model.ingest import REFERENCE, BodyTooLarge, Ingest, _Rewriter
+from mindwm.model.objects import IoDocument
+from starlette.requests import Request
+
+# escapes, multi-byte characters and a surrogate pair all along the text
+output = "total 8\n\tdrwxr-xr-x \"élan\" \\ 日本 \U0001F600 \u0001 end\n" * 300
+document = {
+    'type': 'org.mindwm.v1.iodocument',
+    'input': "cat log",
+    'output': output,
+    'ps1': "$",
+    'tags': ["a", output],
+}
+
+
+def rewrite(doc, field_max, chunk_size, ref_dir=None):
+    raw = json.dumps(doc, ensure_ascii=False).encode()
+    rewriter = _Rewriter(field_max, ref_dir)
+    for i in range(0, len(raw), chunk_size):
+        rewriter.feed(raw[i:i + chunk_size])
+    return rewriter, json.loads(rewriter.out)
+
+
+@pytest.mark.parametrize("field_max", [30, 31, 100, 1000])
+def test_rewrite_cuts_long_strings(field_max):
+    for chunk_size in [1, 5, 4096]:
+        rewriter, doc = rewrite(document, field_max, chunk_size)
+        assert rewriter.truncated == 2
+        assert output.startswith(doc['output'])
+        assert len(doc['output'].encode()) <= field_max
+        assert output.startswith(doc['tags'][1])
+        assert {k: v for k, v in doc.items() if k not in ('output', 'tags')
+                } == {k: document[k] for k in ('type', 'input', 'ps1')}
+
+
+def test_rewrite_references(tmp_path):
+    for chunk_size in [3, 4096]:
+        rewriter, doc = rewrite(document, 100, chunk_size, str(tmp_path))
+        assert len(rewriter.refs) == 1
+        ref = doc['output_ref']
+        with open(os.path.join(tmp_path, ref.split(':')[1]),
+                  encoding='utf-8') as f:
+            assert f.read() == output
+
+
+def request(body: bytes, headers: dict) -> Request:
+    chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+
+    async def receive():
+        return {
+            'type': 'http.request',
+            'body': chunks.pop(0) if chunks else b"",
+            'more_body': bool(chunks)
+        }
+
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/',
+        'query_string': b'',
+        'headers': [(k.lower().encode(), v.encode())
+                    for k, v in headers.items()],
+    }
+    return Request(scope, receive)
+
+
+def iodoc_request(**extra_headers):
+    iodoc = IoDocument(input="cat log", output=output, ps1="$")
+    ev = MindwmEvent(source="src", data=iodoc, type=iodoc.type)
+    headers, body = codec.encode_binary(ev)
+    if extra_headers.get(ENCODING_HEADER) == 'gzip':
+        body = gzip.compress(body)
+    headers.update(extra_headers)
+    return ev, headers, body
+
+
+def test_small_body_is_read_as_is():
+    ev, headers, body = iodoc_request()
+    ingest = Ingest(spill_threshold=len(body), field_max=100)
+    r = request(body, headers)
+    _, read = asyncio.run(ingest.read(r))
+    assert read == body
+    assert ingest.stats()['spilled'] == 0
+
+
+def test_large_body_is_bounded(tmp_path):
+    ev, headers, body = iodoc_request(**{ENCODING_HEADER: 'gzip'})
+    ingest = Ingest(spill_threshold=10000,
+                    field_max=1000,
+                    policy=REFERENCE,
+                    spill_dir=str(tmp_path))
+    read_headers, read = asyncio.run(ingest.read(request(body, headers)))
+    assert ENCODING_HEADER not in read_headers
+    bounded = codec.decode(read_headers, read)
+    assert len(read) < 2000
+    assert ev.data.output.startswith(bounded.data.output)
+    assert bounded.data.output_ref is not None
+    assert ingest.stats()['truncated'] == 1
+
+
+def test_references_go_with_the_request(tmp_path):
+    ev, headers, body = iodoc_request()
+    ingest = Ingest(spill_threshold=10000,
+                    field_max=1000,
+                    policy=REFERENCE,
+                    spill_dir=str(tmp_path))
+    for keep in [False, True]:
+        r = request(body, headers)
+        ingest.hold(r)
+        read_headers, read = asyncio.run(ingest.read(r))
+        ref = codec.decode(read_headers, read).data.output_ref
+        if keep:
+            ingest.keep(ref)
+        ingest.release(r)
+        assert os.path.exists(ingest.path(ref)) == keep
+    assert ingest.stats()['removed'] == 1
+
+
+def test_too_large_body_is_refused():
+    ev, headers, body = iodoc_request()
+    ingest = Ingest(max_size=len(body) - 1)
+    with pytest.raises(BodyTooLarge):
+        asyncio.run(ingest.read(request(body, headers)))
+    assert ingest.stats()['refused'] == 1
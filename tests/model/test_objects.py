@@ -1,6 +1,8 @@
 from uuid import uuid4
 
 import mindwm.model.objects as objects
+import pytest
+from pydantic import ValidationError
 
 models = {
     "iodoc":
@@ -62,3 +64,10 @@ def test_model_dump_json_validate():
         x = v.model_dump_json()
         y = objects.MindwmObject.model_validate_json(x, strict=True)
         assert v == y
+
+
+def test_unknown_type_is_rejected():
+    adapter = objects.MindwmObject.type_adapter()
+    assert objects.MindwmObject.type_adapter() is adapter
+    with pytest.raises(ValidationError):
+        objects.MindwmObject.model_validate({'type': 'org.mindwm.v1.nope'})
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+from mindwm.model.runtime import GraphRuntime
+
+
+def test_failed_init_is_throttled():
+    runtime = GraphRuntime()
+    runtime.uri = "bolt://127.0.0.1:1"
+    runtime.retry_interval = 60
+    assert not runtime.init()
+    assert runtime.health()['state'] == 'failed'
+    assert not runtime.init()
+    assert runtime.attempts == 1
+
+
+def test_run_off_the_event_loop():
+    runtime = GraphRuntime()
+    runtime.executor_workers = 2
+    barrier = threading.Barrier(2, timeout=5)
+
+    async def main():
+        # both calls have to be in flight at once to pass the barrier
+        async with asyncio.TaskGroup() as tg:
+            a = tg.create_task(runtime.run(barrier.wait))
+            b = tg.create_task(runtime.run(barrier.wait))
+        return {a.result(), b.result()}
+
+    assert asyncio.run(main()) == {0, 1}
+
+
+def test_background_init_runs_once_at_a_time():
+    runtime = GraphRuntime()
+    started = threading.Event()
+    release = threading.Event()
+
+    def connect():
+        started.set()
+        release.wait(5)
+
+    runtime._connect = connect
+    runtime._constrain = lambda: None
+    runtime.init_background()
+    assert started.wait(5)
+    runtime.init_background()
+    release.set()
+    runtime._pending.result(5)
+    assert runtime.ready and runtime.attempts == 1
@@ -0,0 +1,27 @@
+import mindwm.model.graph as graph
+
+
+def test_unit_of_work_compile():
+    uow = graph.UnitOfWork()
+    user = uow.merge(graph.User(username="alice"))
+    host = uow.merge(graph.Host(hostname="laptop"))
+    iodoc = uow.create(
+        graph.IoDocument(uuid="1234", input="uptime", output="up", ps1="$"))
+    uow.merge(graph.UserHasHost(source=user, target=host))
+    uow.merge(graph.IoDocumentHasUser(source=iodoc, target=user))
+    uow.merge(graph.User(username="bob"))
+    assert len(uow) == 6
+
+    cypher, params = uow.compile()
+    assert list(params.keys()) == [f"batch{i}" for i in range(5)]
+    assert [row['pp'] for row in params['batch0']] == ["alice", "bob"]
+    assert params['batch2'][0]['pp'] == "1234"
+    assert params['batch2'][0]['all_props']['output'] == "up"
+    assert params['batch3'][0]['source_prop'] == "alice"
+    assert params['batch3'][0]['target_prop'] == "laptop"
+    assert cypher.count("CALL {") == 5
+    assert "MERGE (n:User { username: row.pp })" in cypher
+    assert "CREATE (n:IoDocument { uuid: row.pp })" in cypher
+    assert "MERGE (source)-[r:HAS_HOST]->(target)" in cypher
+    # nodes go first so the relationships can match them
+    assert cypher.index("IoDocument { uuid") < cypher.index("HAS_HOST")
@@ -0,0 +1,283 @@
+import asyncio
+import json
+
+import pytest
+
+import mindwm.events
+from mindwm.events import NatsInterface, Workers, header_key
+from mindwm.model.codec import MSGPACK_CONTENT_TYPE, compressions, formats
+from mindwm.model.events import MindwmEvent, codec, to_request
+from mindwm.model.objects import Ping, ShowMessage
+
+
+class FakeJetStream:
+
+    def __init__(self, nc):
+        self.nc = nc
+
+    async def publish_async(self, subject, payload=b"", headers=None):
+        await self.nc.publish(subject, payload, headers=headers)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(len(self.nc.published))
+        return future
+
+
+class FakeSub:
+
+    def __init__(self, subject, queue):
+        self.subject = subject
+        self.queue = queue
+        self.drained = False
+
+    async def drain(self):
+        self.drained = True
+
+
+class FakeNats:
+
+    def __init__(self):
+        self.published = []
+        self.headers = []
+        self.flushes = 0
+        self.js_opts = None
+        self.subscriptions = {}
+        self.drained = False
+        self.is_closed = False
+
+    async def subscribe(self, subject, queue="", cb=None, **opts):
+        self.subscriptions[subject] = cb
+        return FakeSub(subject, queue)
+
+    async def drain(self):
+        self.drained = True
+
+    async def publish(self, subject, payload=b"", headers=None):
+        self.published.append((subject, payload))
+        self.headers.append(headers)
+
+    async def flush(self):
+        self.flushes += 1
+
+    def jetstream(self, **opts):
+        self.js_opts = opts
+        return FakeJetStream(self)
+
+
+def events(n):
+    return [
+        MindwmEvent(source="test", type=Ping().type, data=Ping(payload=str(i)))
+        for i in range(n)
+    ]
+
+
+def test_publish_batch():
+    nats = NatsInterface()
+    nats.nc = FakeNats()
+    evs = events(3)
+    asyncio.run(nats.publish_batch("subj", evs))
+    assert nats.nc.published == [("subj", ev.model_dump_json().encode())
+                                 for ev in evs]
+    assert nats.nc.flushes == 1
+
+    acks = asyncio.run(nats.publish_batch("subj", events(2), jetstream=True))
+    assert acks == [4, 5]
+    assert nats.nc.js_opts == {
+        'publish_async_max_pending': nats.js_max_pending
+    }
+
+
+class Msg:
+
+    def __init__(self, source, n):
+        self.data = json.dumps({'message': {'source': source, 'n': n}}).encode()
+        self.headers = {
+            'ce-id': str(n),
+            'ce-subject': 'test',
+            'ce-source': source,
+            'ce-type': 'test'
+        }
+
+
+def test_subscribe_workers():
+    # one pane per queue, the hash of a string changes with the process
+    panes = {}
+    for i in range(100):
+        panes.setdefault(hash(f"pane{i}") % 4, f"pane{i}")
+    sources = list(panes.values())[:3]
+    handled = []
+    running = 0
+    max_running = 0
+
+    async def callback(message):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01 if message['n'] == 0 else 0)
+        handled.append((message['source'], message['n']))
+        running -= 1
+
+    async def run():
+        nats = NatsInterface()
+        nats.nc = FakeNats()
+        await nats.subscribe("subj",
+                             callback,
+                             concurrency=4,
+                             key=header_key('ce-source'))
+        cb = nats.nc.subscriptions["subj"]
+        for n in range(3):
+            for source in sources:
+                await cb(Msg(source, n))
+        pool = nats.subs["subj"]['workers']
+        await pool.stop()
+        return pool
+
+    pool = asyncio.run(run())
+    assert pool.stats()['processed'] == 9
+    assert max_running > 1
+    for source in sources:
+        assert [n for s, n in handled if s == source] == [0, 1, 2]
+
+
+def test_workers_failure():
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def run():
+        pool = Workers("subj", concurrency=2)
+        await pool.submit(fail)
+        await pool.stop()
+        return pool
+
+    assert asyncio.run(run()).stats()['failed'] == 1
+
+
+def test_queue_group_drain():
+    handled = []
+
+    async def callback(message):
+        await asyncio.sleep(0)
+        handled.append(message['n'])
+
+    async def run():
+        nats = NatsInterface()
+        nats.queue = "replicas"
+        nats.nc = FakeNats()
+        await nats.subscribe("subj", callback, concurrency=2)
+        await nats.subscribe("other", callback, queue="")
+        for n in range(4):
+            await nats.nc.subscriptions["subj"](Msg("pane", n))
+        await nats.drain()
+        return nats
+
+    nats = asyncio.run(run())
+    assert nats.subs["subj"]['sub'].queue == "replicas"
+    assert nats.subs["other"]['sub'].queue == ""
+    assert all(sub['sub'].drained for sub in nats.subs.values())
+    assert nats.nc.drained
+    assert sorted(handled) == [0, 1, 2, 3]
+
+
+class RawMsg:
+
+    def __init__(self, data, headers=None):
+        self.data = data
+        self.headers = headers
+
+
+def test_typed_subscription():
+    received = []
+
+    async def callback(obj):
+        received.append(obj)
+
+    ev = events(1)[0]
+    headers, body = to_request(ev)
+
+    async def run():
+        nats = NatsInterface()
+        nats.nc = FakeNats()
+        await nats.subscribe("events", callback, model=MindwmEvent)
+        await nats.subscribe("pings", callback, model=Ping)
+        await nats.nc.subscriptions["events"](RawMsg(body, headers))
+        await nats.nc.subscriptions["pings"](RawMsg(
+            ev.model_dump_json().encode()))
+        await nats.nc.subscriptions["pings"](RawMsg(b'{"type": "unknown"}'))
+
+    asyncio.run(run())
+    assert received == [ev, ev.data]
+
+
+def test_publish_binary_format():
+    fmt = formats.get(MSGPACK_CONTENT_TYPE)
+    if fmt is None:
+        pytest.skip("msgpack is not available")
+
+    received = []
+
+    async def callback(obj):
+        received.append(obj)
+
+    async def run():
+        nats = NatsInterface()
+        nats.nc = FakeNats()
+        nats.body_format = fmt
+        ev = events(1)[0]
+        await nats.publish("subj", ev)
+        await nats.subscribe("subj", callback, model=MindwmEvent)
+        [(_, body)] = nats.nc.published
+        await nats.nc.subscriptions["subj"](RawMsg(body,
+                                                   nats.nc.headers[-1]))
+        return ev
+
+    assert received == [asyncio.run(run())]
+
+
+def test_untyped_subscription_of_compressed_event(monkeypatch):
+    monkeypatch.setattr(codec, 'compression', compressions['gzip'])
+    monkeypatch.setattr(codec, 'compress_threshold', 0)
+    received = []
+
+    async def callback(message):
+        received.append(message)
+
+    async def run():
+        nats = NatsInterface()
+        nats.nc = FakeNats()
+        msg = ShowMessage(title="t", message="hi", parent_uuid="1", targets=[])
+        await nats.publish("subj", MindwmEvent(data=msg, type=msg.type))
+        await nats.subscribe("subj", callback)
+        [(_, body)] = nats.nc.published
+        await nats.nc.subscriptions["subj"](RawMsg(body,
+                                                   nats.nc.headers[-1]))
+
+    asyncio.run(run())
+    assert received == ["hi"]
+
+
+def test_reconnect_retries_until_connected(monkeypatch):
+    attempts = []
+
+    async def connect(url, **opts):
+        attempts.append(url)
+        if len(attempts) < 3:
+            raise ConnectionRefusedError("server is down")
+        return FakeNats()
+
+    monkeypatch.setattr(mindwm.events.nats, 'connect', connect)
+
+    async def callback(message):
+        pass
+
+    async def run():
+        nats = NatsInterface()
+        nats.reconnect_wait = 0.01
+        nats.nc = FakeNats()
+        await nats.subscribe("subj", callback)
+        nats.nc.is_closed = True
+        await nats._closed()
+        return nats
+
+    nats = asyncio.run(asyncio.wait_for(run(), 5))
+    assert len(attempts) == 3
+    assert "subj" in nats.nc.subscriptions
@@ -0,0 +1,21 @@
+from mindwm import tracing
+from opentelemetry import trace
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def test_propagate_forwards_trace_headers(monkeypatch):
+    monkeypatch.setattr(tracing, '_mode', tracing.PROPAGATE)
+    tracer = trace.get_tracer(__name__)
+    carrier = {'traceparent': TRACEPARENT, 'tracestate': 'k=v', 'ce-id': '1'}
+    with tracing.start_span(tracer, "test", carrier) as (span, headers):
+        assert not span.is_recording()
+        assert headers == {'traceparent': TRACEPARENT, 'tracestate': 'k=v'}
+
+
+def test_off_forwards_nothing(monkeypatch):
+    monkeypatch.setattr(tracing, '_mode', tracing.OFF)
+    tracer = trace.get_tracer(__name__)
+    with tracing.start_span(tracer, "test",
+                            {'traceparent': TRACEPARENT}) as (_, headers):
+        assert headers == {}